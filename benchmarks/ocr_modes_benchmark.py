@@ -0,0 +1,64 @@
+# Description: Benchmark comparing per-ROI OCR against single-call-per-patch OCR (Tesseract word boxes).
+# Run from the repository root with:
+#   python -m benchmarks.ocr_modes_benchmark --patches-dir Dataset/Demo/Patches --east-model src/detection/models/frozen_east_text_detection.pb
+# Import necessary libraries
+import argparse
+import difflib
+import os
+import time
+import cv2
+
+from src.detection.east_text_detector import EASTTextDetector
+from src.detection.ocr_engine import OCREngine
+
+# Function to normalise OCR output before comparing the two modes
+def normalise(text):
+    return ' '.join(text.split()).upper()
+
+# Function to time one OCR mode over the located text boxes of every patch
+def run_mode(engine, patches, boxes_per_patch):
+    start_time = time.perf_counter()
+    texts_per_patch = engine.recognise_regions(patches, boxes_per_patch)
+    return texts_per_patch, time.perf_counter() - start_time
+
+# Main function to report throughput and text agreement of the two OCR modes
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-ROI and per-patch OCR modes.")
+    parser.add_argument("--patches-dir", required=True, help="Directory of 448x448 patch JPEGs")
+    parser.add_argument("--east-model", required=True, help="Path to frozen_east_text_detection.pb")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of patches to use")
+    parser.add_argument("--workers", type=int, default=4, help="OCR workers for both modes")
+    args = parser.parse_args()
+
+    patch_files = sorted(f for f in os.listdir(args.patches_dir) if f.endswith(".jpg"))[:args.limit]
+    patches = [cv2.imread(os.path.join(args.patches_dir, f)) for f in patch_files]
+    patches = [patch for patch in patches if patch is not None]
+
+    # Locate text once so both modes OCR exactly the same boxes
+    with OCREngine(workers=args.workers, mode='roi') as roi_engine, OCREngine(workers=args.workers, mode='page') as page_engine:
+        detector = EASTTextDetector(args.east_model, ocr_engine=roi_engine)
+        located = detector.locate_text_batch(patches)
+        boxes_per_patch = [[box for box in boxes if box[2] > box[0] and box[3] > box[1]] for boxes in located]
+        num_boxes = sum(len(boxes) for boxes in boxes_per_patch)
+
+        roi_texts, roi_time = run_mode(roi_engine, patches, boxes_per_patch)
+        page_texts, page_time = run_mode(page_engine, patches, boxes_per_patch)
+
+    # Agreement per box: exact match after normalisation and mean character-level similarity
+    exact = 0
+    similarity = 0.0
+    for roi_patch_texts, page_patch_texts in zip(roi_texts, page_texts):
+        for roi_text, page_text in zip(roi_patch_texts, page_patch_texts):
+            roi_text, page_text = normalise(roi_text), normalise(page_text)
+            exact += roi_text == page_text
+            similarity += difflib.SequenceMatcher(None, roi_text, page_text).ratio()
+
+    print(f"Patches: {len(patches)}, text boxes: {num_boxes}")
+    print(f"ROI mode:  {roi_time:.2f}s, {num_boxes} tesseract calls, {len(patches) / roi_time:.2f} patches/s")
+    print(f"Page mode: {page_time:.2f}s, {len(patches)} tesseract calls, {len(patches) / page_time:.2f} patches/s")
+    if num_boxes:
+        print(f"Speedup:   {roi_time / page_time:.1f}x")
+        print(f"Agreement: {exact / num_boxes:.1%} exact, {similarity / num_boxes:.1%} mean character similarity")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Description: Parity check and timing of the ONNX Runtime backend against the PyTorch YOLOv5 and OpenCV DNN EAST
+# paths. Both backends run over the same tiles; YOLO detections are matched per class by IoU and EAST score and
+# geometry maps are compared directly. Exits non-zero when the backends disagree beyond the tolerances.
+# Run from the repository root with:
+#   python -m benchmarks.onnx_parity --yolo-weights yolov5/runs/train/exp/weights/best.pt --tiles Dataset/Demo/Patches
+# Import necessary libraries
+import argparse
+import glob
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+from src.detection.east_text_detector import EASTTextDetector
+from src.detection.onnx_backend import export_east_onnx, export_yolo_onnx, load_onnx_yolo, onnx_path_for
+from src.detection.yolo_object_detection import load_model
+from src.pipeline.cli import find_latest_weights
+from src.utils.config import PROJECT_ROOT, get_config_section
+
+# Function to compute the IoU matrix between (N, 4) and (M, 4) xyxy boxes
+def iou_matrix(boxes_a, boxes_b):
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+# Function to greedily match two tiles' (N, 6) detections of the same class by IoU, returning
+# (matched pairs, reference count, candidate count, confidence differences)
+def match_detections(reference, candidate, min_iou=0.9):
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, len(reference), len(candidate), []
+    ious = iou_matrix(reference[:, :4], candidate[:, :4])
+    ious[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    matched = 0
+    confidence_diffs = []
+    for _ in range(min(len(reference), len(candidate))):
+        (r, c) = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[r, c] < min_iou:
+            break
+        matched += 1
+        confidence_diffs.append(abs(float(reference[r, 4]) - float(candidate[c, 4])))
+        ious[r, :] = 0
+        ious[:, c] = 0
+    return matched, len(reference), len(candidate), confidence_diffs
+
+# Function to load the tiles to compare: patch images from a directory, or synthetic drawing-like tiles
+def load_tiles(tiles_dir, count, seed=0):
+    if tiles_dir:
+        paths = sorted(glob.glob(os.path.join(tiles_dir, '*.jpg')))[:count]
+        return [np.array(Image.open(path).convert('RGB')) for path in paths]
+    rng = np.random.default_rng(seed)
+    tiles = []
+    for _ in range(count):
+        tile = np.full((448, 448, 3), 255, dtype=np.uint8)
+        for _ in range(20):
+            (x, y) = rng.integers(0, 400, size=2)
+            tile[y:y + rng.integers(2, 40), x:x + rng.integers(2, 40)] = 0
+        tiles.append(tile)
+    return tiles
+
+# Function to time a callable over a list of tiles, returning (result, tiles per second)
+def timed(fn, tiles):
+    start_time = time.perf_counter()
+    result = fn(tiles)
+    return result, len(tiles) / max(time.perf_counter() - start_time, 1e-9)
+
+# Function to run a hub-style model over tiles batch_size at a time, returning one (N, 6) numpy array per tile
+def detect_in_batches(model, tiles, batch_size):
+    detections = []
+    for start in range(0, len(tiles), batch_size):
+        for tile_detections in model(tiles[start:start + batch_size]).xyxy:
+            detections.append(tile_detections.cpu().numpy() if hasattr(tile_detections, 'cpu') else tile_detections)
+    return detections
+
+# Main function to compare the backends and report parity and throughput
+def main():
+    parser = argparse.ArgumentParser(description="Check the ONNX Runtime backend against the PyTorch/OpenCV paths.")
+    parser.add_argument("--yolo-weights", default=None, help="YOLOv5 weights (default: best.pt of the latest training run)")
+    parser.add_argument("--east-model", default=os.path.join(PROJECT_ROOT, 'src', 'detection', 'models', 'frozen_east_text_detection.pb'))
+    parser.add_argument("--tiles", default=None, help="Directory of 448x448 patch images (default: synthetic tiles)")
+    parser.add_argument("--count", type=int, default=64, help="Number of tiles to compare")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--export", action="store_true", help="Export both models to ONNX before comparing")
+    parser.add_argument("--min-iou", type=float, default=0.9, help="IoU for a YOLO detection to count as the same box")
+    parser.add_argument("--min-match", type=float, default=0.98, help="Fraction of detections that must match")
+    parser.add_argument("--map-tolerance", type=float, default=1e-3, help="Largest allowed EAST score map difference")
+    args = parser.parse_args()
+
+    yolo_weights = args.yolo_weights or find_latest_weights(os.path.join(PROJECT_ROOT, 'yolov5', 'runs', 'train'))
+    if args.export:
+        export_yolo_onnx(yolo_weights)
+        export_east_onnx(args.east_model)
+    onnx_config = get_config_section('onnxruntime')
+    tiles = load_tiles(args.tiles, args.count)
+    print(f"Comparing backends on {len(tiles)} tiles")
+
+    # YOLOv5: PyTorch hub-style model against the ONNX export, batch by batch
+    torch_model = load_model(yolo_weights)
+    onnx_model = load_onnx_yolo(onnx_path_for(yolo_weights), onnx_config)
+    torch_detections, torch_rate = timed(lambda images: detect_in_batches(torch_model, images, args.batch_size), tiles)
+    onnx_detections, onnx_rate = timed(lambda images: detect_in_batches(onnx_model, images, args.batch_size), tiles)
+    totals = np.zeros(3)
+    confidence_diffs = []
+    for reference, candidate in zip(torch_detections, onnx_detections):
+        matched, reference_count, candidate_count, diffs = match_detections(reference, candidate, args.min_iou)
+        totals += (matched, reference_count, candidate_count)
+        confidence_diffs.extend(diffs)
+    yolo_match = totals[0] / max(totals[1], totals[2], 1)
+    print(f"YOLOv5: {int(totals[0])} matched of {int(totals[1])} PyTorch / {int(totals[2])} ONNX detections ({yolo_match:.1%}), "
+          f"max confidence difference {max(confidence_diffs, default=0.0):.4f}")
+    print(f"YOLOv5: PyTorch {torch_rate:.1f} tiles/s, ONNX Runtime {onnx_rate:.1f} tiles/s")
+
+    # EAST: the same blob through OpenCV DNN and ONNX Runtime, comparing raw maps and decoded boxes
+    opencv_detector = EASTTextDetector(args.east_model, backend='cpu', batch_size=args.batch_size)
+    onnx_detector = EASTTextDetector(args.east_model, backend='onnxruntime', batch_size=args.batch_size, onnx_config=onnx_config)
+    opencv_maps = opencv_detector._forward(tiles[:args.batch_size], rgb=True)
+    onnx_maps = onnx_detector._forward(tiles[:args.batch_size], rgb=True)
+    score_diff = max(float(np.abs(a[0] - b[0]).max()) for a, b in zip(opencv_maps, onnx_maps))
+    geometry_diff = max(float(np.abs(a[1] - b[1]).max()) for a, b in zip(opencv_maps, onnx_maps))
+    opencv_boxes, opencv_rate = timed(lambda images: opencv_detector._locate_uncached(images, True), tiles)
+    onnx_boxes, onnx_east_rate = timed(lambda images: onnx_detector._locate_uncached(images, True), tiles)
+    same_boxes = sum(sorted(a) == sorted(b) for a, b in zip(opencv_boxes, onnx_boxes))
+    print(f"EAST: max score map difference {score_diff:.2e}, max geometry difference {geometry_diff:.2e}, "
+          f"identical boxes on {same_boxes}/{len(tiles)} tiles")
+    print(f"EAST: OpenCV DNN {opencv_rate:.1f} tiles/s, ONNX Runtime {onnx_east_rate:.1f} tiles/s")
+
+    passed = yolo_match >= args.min_match and score_diff <= args.map_tolerance
+    print("Parity check passed." if passed else "Parity check FAILED.")
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
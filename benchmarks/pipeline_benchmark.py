@@ -0,0 +1,353 @@
+# Description: Reproducible end-to-end benchmark of the pipeline on synthetic P&ID pages (pipes, symbol glyphs and
+# tag labels drawn from a seed), so no proprietary drawings are needed. Each stage (rasterise, tile, YOLO, EAST, OCR,
+# consolidate, reconstruct) and the full streaming pipeline is timed per page and reported as JSON with pages/s,
+# tiles/s, p50/p95 page latency and peak RSS. Stages whose model, executable or weights are missing are reported as
+# skipped. Pass --baseline with the JSON of an earlier commit to compare against it.
+# Run from the repository root with:
+#   python -m benchmarks.pipeline_benchmark --pages 4 --yolo-weights yolov5/runs/train/exp/weights/best.pt
+# Import necessary libraries
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from src.detection.east_text_detector import EASTTextDetector, save_text_results
+from src.detection.ocr_engine import OCREngine
+from src.detection.yolo_object_detection import detect_objects_in_images, load_model_from_config
+from src.pipeline.page_pipeline import create_worker_pools, load_page, process_page
+from src.postprocessing.image_deconstruction import find_content_tiles, patch_filename_for, patch_size, slice_image, step_size, tile_image
+from src.postprocessing.image_reconstruction import reconstruct_images
+from src.postprocessing.text_extraction import consolidate_text
+from src.preprocessing.pdf_to_image_converter import iter_pdf_pages
+from src.utils.config import PROJECT_ROOT, load_config, get_config_section
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stages in the order they run
+STAGES = ['rasterise', 'tile', 'yolo', 'east', 'ocr', 'consolidate', 'reconstruct', 'pipeline']
+
+# Tag prefixes of the synthetic text labels
+TAG_PREFIXES = ['FV', 'PT', 'TT', 'LT', 'FIC', 'PCV', 'HV', 'XV', 'PSV', 'LIC']
+
+# Function to draw one symbol glyph (valve, instrument bubble, reducer or panel) centred on (x, y)
+def draw_symbol(page, rng, x, y, size):
+    half = size // 2
+    kind = rng.integers(4)
+    if kind == 0:
+        # Valve: two triangles tip to tip
+        cv2.polylines(page, [np.array([[x - half, y - half // 2], [x, y], [x - half, y + half // 2]], np.int32),
+                             np.array([[x + half, y - half // 2], [x, y], [x + half, y + half // 2]], np.int32)], True, 0, 2)
+    elif kind == 1:
+        # Field instrument: a bubble split by a bar
+        cv2.circle(page, (x, y), half, 0, 2)
+        cv2.line(page, (x - half, y), (x + half, y), 0, 1)
+    elif kind == 2:
+        # Reducer: a trapezoid
+        cv2.polylines(page, [np.array([[x - half, y - half], [x + half, y - half // 2], [x + half, y + half // 2], [x - half, y + half]], np.int32)],
+                      True, 0, 2)
+    else:
+        # Control system / panel: a box with a diamond inside
+        cv2.rectangle(page, (x - half, y - half), (x + half, y + half), 0, 2)
+        cv2.polylines(page, [np.array([[x, y - half], [x + half, y], [x, y + half], [x - half, y]], np.int32)], True, 0, 1)
+
+# Function to generate a synthetic P&ID page as an RGB array, returning (page, label boxes, label texts) with the
+# label boxes in page coordinates
+def make_page(rng, width, height, lines=80, symbols=150, labels=200):
+    page = np.full((height, width), 255, dtype=np.uint8)
+
+    # Pipes: horizontal and vertical runs, some with an elbow
+    for _ in range(lines):
+        (x0, y0) = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        (x1, y1) = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        thickness = int(rng.integers(1, 4))
+        if rng.random() < 0.5:
+            cv2.line(page, (x0, y0), (x1, y0), 0, thickness)
+            cv2.line(page, (x1, y0), (x1, y1), 0, thickness)
+        else:
+            cv2.line(page, (x0, y0), (x0, y1), 0, thickness)
+
+    for _ in range(symbols):
+        draw_symbol(page, rng, int(rng.integers(40, width - 40)), int(rng.integers(40, height - 40)), int(rng.integers(30, 70)))
+
+    # Tag labels, with their boxes kept as the regions to OCR
+    label_boxes = []
+    label_texts = []
+    for _ in range(labels):
+        text = f"{TAG_PREFIXES[rng.integers(len(TAG_PREFIXES))]}-{rng.integers(100, 1000)}"
+        scale = float(rng.uniform(0.6, 1.0))
+        ((text_w, text_h), baseline) = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+        (x, y) = (int(rng.integers(0, width - text_w)), int(rng.integers(text_h, height - baseline)))
+        cv2.rectangle(page, (x - 2, y - text_h - 2), (x + text_w + 2, y + baseline + 2), 255, -1)
+        cv2.putText(page, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, 2, cv2.LINE_AA)
+        label_boxes.append((x - 2, y - text_h - 2, x + text_w + 2, y + baseline + 2))
+        label_texts.append(text)
+
+    return np.stack([page] * 3, axis=2), label_boxes, label_texts
+
+# Function to assign page-coordinate label boxes to the tiles that fully contain them, in tile-local coordinates
+def label_boxes_per_tile(label_boxes, grid):
+    boxes = np.array(label_boxes, dtype=np.int64).reshape(-1, 4)
+    boxes_per_tile = []
+    for i, j in grid:
+        (x0, y0) = (j * step_size, i * step_size)
+        inside = (boxes[:, 0] >= x0) & (boxes[:, 1] >= y0) & (boxes[:, 2] <= x0 + patch_size[1]) & (boxes[:, 3] <= y0 + patch_size[0])
+        boxes_per_tile.append([tuple(int(c) for c in box) for box in boxes[inside] - [x0, y0, x0, y0]])
+    return boxes_per_tile
+
+# Function to reset the peak resident set size of this process where the OS allows it (Linux clear_refs)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+# Function to read the peak resident set size in MB: since the last reset on Linux, else since the process started
+def peak_rss_mb(since_reset=True):
+    if since_reset and os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    return None
+
+# Function to time a stage page by page, returning its throughput, page latency percentiles and peak RSS; prepare
+# loads a page's input outside the timed region
+def measure(run_page, pages, tiles_per_page, prepare=None):
+    peak_is_per_stage = reset_peak_rss()
+    latencies = []
+    for k in range(pages):
+        page_input = prepare(k) if prepare is not None else k
+        start_time = time.perf_counter()
+        run_page(page_input)
+        latencies.append(time.perf_counter() - start_time)
+        page_input = None
+    total = sum(latencies)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'pages': pages, 'tiles': int(sum(tiles_per_page)), 'seconds': total,
+        'pages_per_second': pages / max(total, 1e-9), 'tiles_per_second': sum(tiles_per_page) / max(total, 1e-9),
+        'page_latency_p50_ms': float(np.percentile(latencies_ms, 50)), 'page_latency_p95_ms': float(np.percentile(latencies_ms, 95)),
+        'peak_rss_mb': peak_rss_mb(), 'peak_rss_scope': 'stage' if peak_is_per_stage else 'process',
+    }
+
+# Function to get the commit being benchmarked, or None outside a git checkout
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to print each stage's throughput and p95 latency against a baseline report, returning the stages whose
+# throughput dropped by more than max_regression
+def compare_reports(report, baseline, max_regression):
+    regressions = []
+    print(f"\nAgainst baseline {baseline.get('commit')}:")
+    for stage in STAGES:
+        current, previous = report['stages'].get(stage, {}), baseline.get('stages', {}).get(stage, {})
+        if 'tiles_per_second' not in current or 'tiles_per_second' not in previous:
+            continue
+        throughput_ratio = current['tiles_per_second'] / max(previous['tiles_per_second'], 1e-9)
+        latency_ratio = current['page_latency_p95_ms'] / max(previous['page_latency_p95_ms'], 1e-9)
+        print(f"  {stage:<12} tiles/s x{throughput_ratio:.2f}, p95 latency x{latency_ratio:.2f}")
+        if throughput_ratio < 1 - max_regression:
+            regressions.append(stage)
+    return regressions
+
+# Function to parse the command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic P&ID pages.")
+    parser.add_argument("--pages", type=int, default=4, help="Synthetic pages to generate")
+    parser.add_argument("--width", type=int, default=6622, help="Page width in pixels (default: A1 landscape at 200 dpi)")
+    parser.add_argument("--height", type=int, default=4680, help="Page height in pixels")
+    parser.add_argument("--lines", type=int, default=80, help="Pipe runs per page")
+    parser.add_argument("--symbols", type=int, default=150, help="Symbol glyphs per page")
+    parser.add_argument("--labels", type=int, default=200, help="Tag labels per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=','.join(STAGES), help=f"Comma-separated stages to run, from {','.join(STAGES)}")
+    parser.add_argument("--yolo-weights", default=None, help="YOLOv5 weights (default: best.pt of the latest training run, if any)")
+    parser.add_argument("--east-model", default=os.path.join(PROJECT_ROOT, 'src', 'detection', 'models', 'frozen_east_text_detection.pb'))
+    parser.add_argument("--tesseract-cmd", default=None, help="Tesseract executable (default: as the CLI resolves it)")
+    parser.add_argument("--output", default=None, help="JSON report path (default: outputs/benchmarks/pipeline_<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Largest allowed drop in tiles/s against the baseline")
+    parser.add_argument("--config", default=None, help="Path to an alternative config.yaml")
+    return parser.parse_args(argv)
+
+# Main function to generate the pages, run the selected stages and write the JSON report
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config) if args.config else load_config()
+    batch_size = get_config_section('object_detection', config).get('batch_size', 32)
+    tile_filter_config = get_config_section('tile_filter', config)
+    (min_ink_fraction, ink_threshold) = (tile_filter_config.get('min_ink_fraction', 0.002), tile_filter_config.get('ink_threshold', 160))
+    dpi = get_config_section('pdf_conversion', config).get('dpi', 200)
+    selected = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(selected) - set(STAGES)
+    if unknown:
+        print(f"Unknown stages: {', '.join(sorted(unknown))}. Expected some of {', '.join(STAGES)}.")
+        return 2
+
+    # Resolve what the model stages need; a missing dependency skips the stages that use it
+    tesseract_cmd = args.tesseract_cmd or pytesseract.pytesseract.tesseract_cmd
+    if not args.tesseract_cmd and not os.path.exists(tesseract_cmd):
+        tesseract_cmd = shutil.which('tesseract')
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd or 'tesseract'
+    yolo_weights = args.yolo_weights
+    if yolo_weights is None:
+        from src.pipeline.cli import find_latest_weights
+        try:
+            yolo_weights = find_latest_weights(os.path.join(PROJECT_ROOT, 'yolov5', 'runs', 'train'))
+        except FileNotFoundError:
+            pass
+    missing = {
+        'rasterise': None if shutil.which('pdftoppm') else "poppler (pdftoppm) not found on the PATH",
+        'yolo': None if yolo_weights and os.path.exists(yolo_weights) else "no YOLOv5 weights (pass --yolo-weights)",
+        'east': None if os.path.exists(args.east_model) else f"EAST model not found: {args.east_model}",
+        'ocr': None if tesseract_cmd else "tesseract not found (pass --tesseract-cmd)",
+    }
+    missing['pipeline'] = missing['yolo'] or missing['east'] or missing['ocr']
+
+    report = {
+        'benchmark': 'pipeline', 'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                        'opencv': cv2.__version__, 'numpy': np.__version__},
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'baseline')},
+        'stages': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='pipeline_benchmark_') as work_dir:
+        # Generate the pages from the seed and save them as the JPEG inputs (and PDFs) the pipeline reads
+        image_dir = os.path.join(work_dir, 'Images')
+        os.makedirs(image_dir)
+        pages = []
+        for k in range(args.pages):
+            page, label_boxes, label_texts = make_page(np.random.default_rng([args.seed, k]), args.width, args.height,
+                                                       args.lines, args.symbols, args.labels)
+            image_path = os.path.join(image_dir, f"synthetic_{k}.jpg")
+            Image.fromarray(page).save(image_path, quality=95)
+            if 'rasterise' in selected and missing['rasterise'] is None:
+                Image.fromarray(page[:, :, 0]).save(os.path.join(work_dir, f"synthetic_{k}.pdf"), resolution=dpi)
+            pages.append({'path': image_path, 'label_boxes': label_boxes, 'label_texts': label_texts})
+        print(f"Generated {args.pages} synthetic {args.width}x{args.height} pages in {work_dir}")
+
+        # Tiling is also the input of every model stage, so the tile grid of each page is always built
+        for page_info in pages:
+            page = load_page(page_info['path'])
+            content_tiles = find_content_tiles(page, min_ink_fraction, ink_threshold)
+            page_info['grid'] = [tuple(int(c) for c in index) for index in np.argwhere(content_tiles)]
+            page_info['filenames'] = [patch_filename_for(os.path.basename(page_info['path']), i, j) for i, j in page_info['grid']]
+            page_info['tile_boxes'] = label_boxes_per_tile(page_info['label_boxes'], page_info['grid'])
+        tiles_per_page = [len(page_info['grid']) for page_info in pages]
+
+        # Function to load a page and return its content tile views, as process_page does
+        def tiles_of(k):
+            patches = tile_image(load_page(pages[k]['path']))
+            return [patches[i, j] for i, j in pages[k]['grid']]
+
+        model = text_detector = ocr_engine = None
+        ocr_texts = {}
+        prepare = None
+        for stage in selected:
+            if missing.get(stage):
+                report['stages'][stage] = {'skipped': missing[stage]}
+                print(f"{stage}: skipped ({missing[stage]})")
+                continue
+
+            prepare = None
+            if stage == 'rasterise':
+                run_page = lambda k: [page for _, page in iter_pdf_pages(os.path.join(work_dir, f"synthetic_{k}.pdf"), dpi)]
+            elif stage == 'tile':
+                def run_page(k):
+                    page = load_page(pages[k]['path'])
+                    patches = tile_image(page)
+                    content_tiles = find_content_tiles(page, min_ink_fraction, ink_threshold)
+                    return [patches[i, j] for i, j in np.argwhere(content_tiles)]
+            elif stage == 'yolo':
+                model = model or load_model_from_config(yolo_weights, config)
+                # Warm-up batch, so lazy initialisation is not timed
+                detect_objects_in_images(tiles_of(0)[:batch_size], pages[0]['filenames'][:batch_size], model, batch_size)
+                prepare = lambda k: (tiles_of(k), pages[k]['filenames'])
+                run_page = lambda page_input: detect_objects_in_images(*page_input, model, batch_size)
+            elif stage == 'east':
+                text_detector = text_detector or EASTTextDetector.from_config(args.east_model, config)
+                text_detector._locate_uncached(tiles_of(0)[:text_detector.batch_size], True)
+                prepare = tiles_of
+                run_page = lambda tiles: text_detector._locate_uncached(tiles, True)
+            elif stage == 'ocr':
+                # The synthetic label boxes are OCR'd, so this stage does not depend on EAST
+                ocr_engine = ocr_engine or OCREngine.from_config(config)
+                prepare = lambda k: (k, tiles_of(k))
+                def run_page(page_input):
+                    (k, tiles) = page_input
+                    ocr_texts[k] = ocr_engine.recognise_regions(tiles, pages[k]['tile_boxes'])
+            elif stage == 'consolidate':
+                # Per-patch text files of each page in their own directory, from the OCR stage or the label texts
+                for k, page_info in enumerate(pages):
+                    text_dir = os.path.join(work_dir, 'TextDetection', str(k))
+                    os.makedirs(text_dir, exist_ok=True)
+                    label_text_of = dict(zip(page_info['label_boxes'], page_info['label_texts']))
+                    for t, (filename, (i, j), boxes) in enumerate(zip(page_info['filenames'], page_info['grid'], page_info['tile_boxes'])):
+                        texts = ocr_texts[k][t] if k in ocr_texts else [
+                            label_text_of.get((x0 + j * step_size, y0 + i * step_size, x1 + j * step_size, y1 + i * step_size), '')
+                            for x0, y0, x1, y1 in boxes]
+                        save_text_results(filename, texts, boxes, text_dir)
+                run_page = lambda k: consolidate_text(os.path.join(work_dir, 'TextDetection', str(k)))
+            elif stage == 'reconstruct':
+                for k, page_info in enumerate(pages):
+                    patches_dir = os.path.join(work_dir, 'Patches', str(k))
+                    os.makedirs(patches_dir, exist_ok=True)
+                    slice_image(page_info['path'], patches_dir, min_ink_fraction, ink_threshold)
+                run_page = lambda k: reconstruct_images(os.path.join(work_dir, 'Patches', str(k)), os.path.join(work_dir, 'Reconstructed'))
+            elif stage == 'pipeline':
+                model = model or load_model_from_config(yolo_weights, config)
+                ocr_engine = ocr_engine or OCREngine.from_config(config)
+                pipeline_detector = EASTTextDetector.from_config(args.east_model, config, ocr_engine=ocr_engine)
+                pools = create_worker_pools()
+                run_page = lambda k: process_page(pages[k]['path'], model, pipeline_detector, os.path.join(work_dir, 'PipelineText'),
+                                                  os.path.join(work_dir, 'Output'), batch_size, pools, min_ink_fraction, ink_threshold)
+
+            report['stages'][stage] = measure(run_page, len(pages), tiles_per_page, prepare)
+            result = report['stages'][stage]
+            print(f"{stage}: {result['pages_per_second']:.3f} pages/s, {result['tiles_per_second']:.1f} tiles/s, "
+                  f"p50 {result['page_latency_p50_ms']:.0f} ms, p95 {result['page_latency_p95_ms']:.0f} ms, peak RSS {result['peak_rss_mb']:.0f} MB")
+            if stage == 'pipeline':
+                for pool in pools:
+                    pool.shutdown()
+        if ocr_engine is not None:
+            ocr_engine.close()
+
+    report['process_peak_rss_mb'] = peak_rss_mb(since_reset=False)
+    output_path = args.output or os.path.join(PROJECT_ROOT, 'outputs', 'benchmarks', f"pipeline_{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Benchmark report saved to: {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.max_regression)
+        if regressions:
+            print(f"Throughput regressed by more than {args.max_regression:.0%} in: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
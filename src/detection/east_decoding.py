@@ -0,0 +1,37 @@
+# Description: Vectorised decoding of the EAST score and geometry maps into text bounding boxes.
+# Import necessary libraries
+import numpy as np
+
+# Function to decode EAST output maps into candidate boxes and their confidence scores
+def decode_predictions(scores, geometry, min_confidence=0.3):
+    # Accept the raw (1, 1, H, W) / (1, 5, H, W) network outputs or already squeezed maps
+    (numRows, numCols) = scores.shape[-2:]
+    scoresData = scores.reshape(numRows, numCols)
+    geometryData = geometry.reshape(5, numRows, numCols)
+
+    # Keep only the cells above the confidence threshold, in row-major order like the original loops
+    ys, xs = np.nonzero(scoresData >= min_confidence)
+    confidences = np.ascontiguousarray(scoresData[ys, xs])
+    if len(confidences) == 0:
+        return np.empty((0, 4), dtype=np.int32), confidences
+
+    xData0, xData1, xData2, xData3, anglesData = geometryData[:, ys, xs]
+
+    # Each output cell maps to a 4x4 region of the resized input image
+    offsetX = xs * 4.0
+    offsetY = ys * 4.0
+
+    cos = np.cos(anglesData)
+    sin = np.sin(anglesData)
+
+    h = xData0 + xData2
+    w = xData1 + xData3
+
+    # np.trunc matches the int() casts used by the original per-pixel loops
+    endX = np.trunc(offsetX + (cos * xData1) + (sin * xData2)).astype(np.int64)
+    endY = np.trunc(offsetY - (sin * xData1) + (cos * xData2)).astype(np.int64)
+    startX = np.trunc(endX - w).astype(np.int64)
+    startY = np.trunc(endY - h).astype(np.int64)
+
+    rects = np.stack([startX, startY, endX, endY], axis=1).astype(np.int32)
+    return np.ascontiguousarray(rects), confidences
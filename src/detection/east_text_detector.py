@@ -6,6 +6,12 @@ import numpy as np
 import pytesseract
 import csv
 import re
+import threading
+
+from src.detection.east_decoding import decode_predictions
+from src.detection.ocr_engine import get_default_ocr_engine
+from src.utils.config import get_config_section
+from src.utils.result_cache import StageCache, hash_array, hash_file
 
 # Specify Tesseract executable path if needed
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'  
@@ -18,112 +24,210 @@ def extract_patch_id(filename):
     else:
         return None
 
-# Function to process an image using the EAST text detector and Tesseract OCR
-def detect_text(image_path, model_path, output_dir, patch_id, newW=448, newH=448, min_confidence=0.3):
-    print(f"Processing image: {os.path.basename(image_path)}")
-
-    # Load the pre-trained EAST model
-    net = cv2.dnn.readNet(model_path)
-
-    # Use CUDA if available
-    if cv2.cuda.getCudaEnabledDeviceCount() > 0:
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
-
-    # Specify output layer names for EAST text detector
-    layerNames = ["feature_fusion/Conv_7/Sigmoid", "feature_fusion/concat_3"]
-
-    # Initialize lists to store extracted texts and bounding box coordinates
-    extracted_texts = []
-    bounding_boxes = []
-
-    # Read the original image
-    orig = cv2.imread(image_path)
-    if orig is None:
-        print(f"Failed to load image: {image_path}")
-        return [], ""
-
-    (H, W) = orig.shape[:2]
-
-    # Resize the original image
-    rW = W / float(newW)
-    rH = H / float(newH)
-    image = cv2.resize(orig, (newW, newH))
-    (H, W) = image.shape[:2]
-
-    # Prepare the image for processing
-    blob = cv2.dnn.blobFromImage(image, 1.0, (W, H), (123.68, 116.78, 103.94), swapRB=True, crop=False)
-    net.setInput(blob)
-    (scores, geometry) = net.forward(layerNames)
-
-    # Extract bounding boxes and confidence scores
-    (numRows, numCols) = scores.shape[2:4]
-    rects = []
-    confidences = []
-
-    for y in range(numRows):
-        scoresData = scores[0, 0, y]
-        xData0 = geometry[0, 0, y]
-        xData1 = geometry[0, 1, y]
-        xData2 = geometry[0, 2, y]
-        xData3 = geometry[0, 3, y]
-        anglesData = geometry[0, 4, y]
-
-        for x in range(numCols):
-            if scoresData[x] < min_confidence:
-                continue
-
-            offsetX = x * 4.0
-            offsetY = y * 4.0
-
-            angle = anglesData[x]
-            cos = np.cos(angle)
-            sin = np.sin(angle)
-
-            h = xData0[x] + xData2[x]
-            w = xData1[x] + xData3[x]
-
-            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
-            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
-            startX = int(endX - w)
-            startY = int(endY - h)
-
-            rects.append((startX, startY, endX, endY))
-            confidences.append(scoresData[x])
-
-    # Apply non-maxima suppression to suppress weak overlapping bounding boxes
-    indices = cv2.dnn.NMSBoxes(rects, confidences, 0.3, 0.4)
-
-    # Extract text using Tesseract OCR within each bounding box
-    if len(indices) > 0:
-        for i in indices.flatten():
+# Output layer names for the EAST text detector
+EAST_LAYER_NAMES = ["feature_fusion/Conv_7/Sigmoid", "feature_fusion/concat_3"]
+
+# Loaded EAST networks, keyed by (model path, backend) so each is parsed once per process
+_east_models = {}
+_east_models_lock = threading.Lock()
+
+# One lock per loaded network: detectors in different threads (e.g. Streamlit sessions) share a net, and
+# setInput/forward must not interleave between them
+_east_net_locks = {}
+
+# Function to get the lock that serialises forward passes through a shared network
+def get_net_lock(net):
+    with _east_models_lock:
+        return _east_net_locks.setdefault(id(net), threading.Lock())
+
+# Function to load the EAST network, reusing a previously loaded copy if available
+def load_east_model(model_path, backend='auto', onnx_config=None):
+    if backend == 'onnxruntime':
+        # The ONNX export next to the frozen graph runs in ONNX Runtime behind the same net interface
+        from src.detection.onnx_backend import load_onnx_east, onnx_path_for
+        precision = (onnx_config or {}).get('precision', 'fp32')
+        return load_onnx_east(model_path if model_path.endswith('.onnx') else onnx_path_for(model_path, precision), onnx_config)
+
+    key = (os.path.abspath(model_path), backend)
+    with _east_models_lock:
+        net = _east_models.get(key)
+        if net is None:
+            net = cv2.dnn.readNet(model_path)
+
+            # Use CUDA if requested, or if available when backend is 'auto'
+            if backend == 'cuda' or (backend == 'auto' and cv2.cuda.getCudaEnabledDeviceCount() > 0):
+                net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+                net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+
+            _east_models[key] = net
+    return net
+
+# Reusable text detector holding a single EAST network for all patches
+class EASTTextDetector:
+    def __init__(self, model_path, backend='auto', newW=448, newH=448, min_confidence=0.3, nms_threshold=0.4, batch_size=16, ocr_engine=None,
+                 result_cache=None, onnx_config=None):
+        self.net = load_east_model(model_path, backend, onnx_config)
+        self.net_lock = get_net_lock(self.net)
+        self.ocr_engine = ocr_engine if ocr_engine is not None else get_default_ocr_engine()
+        self.newW = newW
+        self.newH = newH
+        self.min_confidence = min_confidence
+        self.nms_threshold = nms_threshold
+        self.batch_size = max(1, int(batch_size))
+
+        # Optional persistent caches for located boxes and OCR text, keyed by patch content
+        self.text_cache = None
+        self.ocr_cache = None
+        if result_cache is not None:
+            east_params = {'size': (newW, newH), 'min_confidence': min_confidence, 'nms_threshold': nms_threshold}
+            self.text_cache = StageCache(result_cache, 'east', hash_file(getattr(self.net, 'model_path', model_path)), east_params)
+            self.ocr_cache = StageCache(result_cache, 'ocr', 'tesseract', self.ocr_engine.cache_params())
+
+    # Create a detector from the text_detection section of configs/config.yaml
+    @classmethod
+    def from_config(cls, model_path, config=None, ocr_engine=None, result_cache=None):
+        text_config = get_config_section('text_detection', config)
+        return cls(
+            model_path,
+            backend=text_config.get('backend', 'auto'),
+            min_confidence=text_config.get('min_confidence', 0.3),
+            nms_threshold=text_config.get('nms_threshold', 0.4),
+            batch_size=text_config.get('batch_size', 16),
+            ocr_engine=ocr_engine,
+            result_cache=result_cache,
+            onnx_config=get_config_section('onnxruntime', config),
+        )
+
+    # Run one forward pass over a stack of images and split the output maps back out per image
+    def _forward(self, images, rgb=False):
+        # Resize every image to the network input size and stack them into a single 4-D blob
+        resized = [cv2.resize(image, (self.newW, self.newH)) for image in images]
+        blob = cv2.dnn.blobFromImages(resized, 1.0, (self.newW, self.newH), (123.68, 116.78, 103.94), swapRB=not rgb, crop=False)
+        with self.net_lock:
+            self.net.setInput(blob)
+            (scores, geometry) = self.net.forward(EAST_LAYER_NAMES)
+        return [(scores[k:k + 1], geometry[k:k + 1]) for k in range(len(images))]
+
+    # Decode one image's output maps and return NMS-filtered boxes in original image coordinates
+    def _decode_boxes(self, scores, geometry, orig_shape):
+        (H, W) = orig_shape[:2]
+        rW = W / float(self.newW)
+        rH = H / float(self.newH)
+
+        # Extract bounding boxes and confidence scores
+        rects, confidences = decode_predictions(scores, geometry, self.min_confidence)
+
+        # Apply non-maxima suppression to suppress weak overlapping bounding boxes
+        indices = cv2.dnn.NMSBoxes(rects, confidences, self.min_confidence, self.nms_threshold)
+
+        # Scale the surviving boxes back to the original image size
+        boxes = []
+        for i in np.array(indices).flatten():
             (startX, startY, endX, endY) = rects[i]
-            startX = int(startX * rW)
-            startY = int(startY * rH)
-            endX = int(endX * rW)
-            endY = int(endY * rH)
+            boxes.append((int(startX * rW), int(startY * rH), int(endX * rW), int(endY * rH)))
+        return boxes
+
+    # Locate text regions in a list of images (BGR unless rgb=True), running batch_size images per forward pass
+    def locate_text_batch(self, images, rgb=False):
+        if self.text_cache is not None:
+            # Only run the network on images whose content has not been seen before
+            keys = [self.text_cache.key(hash_array(image), {'rgb': rgb}) for image in images]
+            located = self.text_cache.get_or_compute(keys, lambda misses: self._locate_uncached([images[k] for k in misses], rgb))
+            return [[tuple(box) for box in boxes] for boxes in located]
+        return self._locate_uncached(images, rgb)
+
+    # Run the network over every image, batch_size images per forward pass
+    def _locate_uncached(self, images, rgb):
+        all_boxes = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            for image, (scores, geometry) in zip(chunk, self._forward(chunk, rgb)):
+                all_boxes.append(self._decode_boxes(scores, geometry, image.shape))
+        return all_boxes
+
+    # Locate text regions in an image, returning boxes in original image coordinates
+    def locate_text(self, orig):
+        return self.locate_text_batch([orig])[0]
+
+    # Run Tesseract OCR within each located text box of several images through the shared OCR engine
+    def extract_text_batch(self, images, boxes_per_image, draw=False):
+        # Keep only boxes whose region of interest (ROI) is valid
+        valid_boxes = []
+        for orig, boxes in zip(images, boxes_per_image):
+            image_boxes = []
+            for (startX, startY, endX, endY) in boxes:
+                roi = orig[startY:endY, startX:endX]
+                if roi.shape[0] > 0 and roi.shape[1] > 0:
+                    image_boxes.append((startX, startY, endX, endY))
+            valid_boxes.append(image_boxes)
 
-            # Draw bounding box on the original image (before resizing)
-            cv2.rectangle(orig, (startX, startY), (endX, endY), (0, 255, 0), 2)
+        # OCR every box in parallel (per ROI or per image, depending on the engine mode); results keep input order
+        if self.ocr_cache is not None:
+            keys = [self.ocr_cache.key(hash_array(orig), {'boxes': image_boxes}) for orig, image_boxes in zip(images, valid_boxes)]
+            texts_per_image = self.ocr_cache.get_or_compute(
+                keys, lambda misses: self.ocr_engine.recognise_regions([images[k] for k in misses], [valid_boxes[k] for k in misses])
+            )
+        else:
+            texts_per_image = self.ocr_engine.recognise_regions(images, valid_boxes)
 
-            # Crop the region of interest (ROI) using the bounding box coordinates
-            roi = orig[startY:endY, startX:endX]
+        results = []
+        for orig, boxes, image_boxes, extracted_texts in zip(images, boxes_per_image, valid_boxes, texts_per_image):
+            # Draw bounding boxes only after OCR so the strokes never end up inside an ROI
+            if draw:
+                for (startX, startY, endX, endY) in boxes:
+                    cv2.rectangle(orig, (startX, startY), (endX, endY), (0, 255, 0), 2)
 
-            # Check if ROI is valid before resizing and processing
-            if roi.shape[0] > 0 and roi.shape[1] > 0:
-                # Resize ROI if needed (adjust dimensions as necessary)
-                roi = cv2.resize(roi, (roi.shape[1]*4, roi.shape[0]*4))  # Resize by as needed for better OCR results
+            results.append((extracted_texts, image_boxes))
+        return results
 
-                # Use Tesseract to OCR the cropped region
-                text = pytesseract.image_to_string(roi, config='--psm 12')  # Adjust PSM (Page Segmentation Mode) as needed
-                extracted_texts.append(text.strip())  # Append extracted text to list
+    # Run Tesseract OCR within each located text box, optionally drawing the boxes onto the image
+    def extract_text(self, orig, boxes, draw=False):
+        return self.extract_text_batch([orig], [boxes], draw)[0]
 
-                # Save bounding box coordinates adjusted for original image size
-                bounding_boxes.append((startX, startY, endX, endY))
+    # Save the OCR results and the annotated image for one image
+    def _save_results(self, image_path, orig, extracted_texts, bounding_boxes, output_dir):
+        csv_filepath = save_text_results(os.path.basename(image_path), extracted_texts, bounding_boxes, output_dir)
 
+        # Save image with bounding boxes drawn for verification
+        output_image_path = os.path.join(output_dir, f"{os.path.basename(image_path)}")
+        cv2.imwrite(output_image_path, orig)
+
+        return extracted_texts, csv_filepath
+
+    # Detect text in a single image, run Tesseract OCR and save the results
+    def detect(self, image_path, output_dir):
+        return self.detect_batch([image_path], output_dir)[0]
+
+    # Detect text in a list of images, running the network on batch_size patches at a time
+    def detect_batch(self, image_paths, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        results = []
+        for start in range(0, len(image_paths), self.batch_size):
+            # Read the original images, keeping a placeholder for any that fail to load
+            loaded = []
+            for image_path in image_paths[start:start + self.batch_size]:
+                print(f"Processing image: {os.path.basename(image_path)}")
+                orig = cv2.imread(image_path)
+                if orig is None:
+                    print(f"Failed to load image: {image_path}")
+                loaded.append((image_path, orig))
+
+            # One forward pass and one OCR fan-out for the whole chunk, then save each image in order
+            valid = [orig for _, orig in loaded if orig is not None]
+            extracted = iter(self.extract_text_batch(valid, self.locate_text_batch(valid), draw=True))
+            for image_path, orig in loaded:
+                if orig is None:
+                    results.append(([], ""))
+                else:
+                    extracted_texts, bounding_boxes = next(extracted)
+                    results.append(self._save_results(image_path, orig, extracted_texts, bounding_boxes, output_dir))
+        return results
+
+# Function to save extracted texts and their bounding boxes for one patch, returning the CSV path
+def save_text_results(image_filename, extracted_texts, bounding_boxes, output_dir):
     # Save extracted texts to a text file with patch ID in the name
     # Remove patch_id from the text_filename to prevent appending to the start
-    text_filename = f"text_extraction_{os.path.basename(image_path)}.txt"
+    text_filename = f"text_extraction_{image_filename}.txt"
     text_filepath = os.path.join(output_dir, text_filename)
     with open(text_filepath, 'w', encoding='utf-8') as text_file:
         for text in extracted_texts:
@@ -131,7 +235,7 @@ def detect_text(image_path, model_path, output_dir, patch_id, newW=448, newH=448
 
     # Save bounding box coordinates to a CSV file with patch ID in the name
     # Remove patch_id from the csv_filename to prevent appending to the start
-    csv_filename = f"bounding_boxes_{os.path.basename(image_path)}.csv"
+    csv_filename = f"bounding_boxes_{image_filename}.csv"
     csv_filepath = os.path.join(output_dir, csv_filename)
     with open(csv_filepath, mode='w', newline='') as csv_file:
         csv_writer = csv.writer(csv_file)
@@ -139,11 +243,13 @@ def detect_text(image_path, model_path, output_dir, patch_id, newW=448, newH=448
         for bbox in bounding_boxes:
             csv_writer.writerow(bbox)
 
-    # Save image with bounding boxes drawn for verification
-    output_image_path = os.path.join(output_dir, f"{os.path.basename(image_path)}")
-    cv2.imwrite(output_image_path, orig)
+    return csv_filepath
 
-    return extracted_texts, csv_filepath
+# Function to process an image using the EAST text detector and Tesseract OCR
+def detect_text(image_path, model_path, output_dir, patch_id, newW=448, newH=448, min_confidence=0.3):
+    # The network itself is cached by load_east_model, so this no longer reloads it per patch
+    detector = EASTTextDetector(model_path, newW=newW, newH=newH, min_confidence=min_confidence)
+    return detector.detect(image_path, output_dir)
 
 # Function to load image paths from a directory
 def load_image_paths(directory):
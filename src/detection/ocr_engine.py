@@ -0,0 +1,155 @@
+# Description: Tesseract OCR engine that fans text regions out across a worker pool while preserving output order.
+# Import necessary libraries
+import threading
+import cv2
+import numpy as np
+import pytesseract
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from src.utils.config import get_config_section
+
+# Function to set the Tesseract executable in each worker (needed for process pools)
+def _init_worker(tesseract_cmd):
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+# Function to OCR a single region of interest
+def ocr_roi(roi, upscale=4, psm=12):
+    # Resize ROI for better OCR results
+    roi = cv2.resize(roi, (roi.shape[1] * upscale, roi.shape[0] * upscale))
+    text = pytesseract.image_to_string(roi, config=f'--psm {psm}')
+    return text.strip()
+
+# Function to assign recognised words to text boxes by overlap, returning one string per box
+def assign_words_to_boxes(word_boxes, words, boxes, min_overlap=0.5):
+    if len(boxes) == 0:
+        return []
+    if len(words) == 0:
+        return ['' for _ in boxes]
+
+    word_boxes = np.asarray(word_boxes, dtype=np.float32).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+    # Intersection of every word with every box, as a fraction of the word's own area
+    inter_w = np.clip(np.minimum(word_boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(word_boxes[:, None, 0], boxes[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(word_boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(word_boxes[:, None, 1], boxes[None, :, 1]), 0, None)
+    word_areas = np.maximum((word_boxes[:, 2] - word_boxes[:, 0]) * (word_boxes[:, 3] - word_boxes[:, 1]), 1.0)
+    overlap = (inter_w * inter_h) / word_areas[:, None]
+
+    # Each word goes to the box it overlaps most; words keep Tesseract's reading order within a box
+    best_box = overlap.argmax(axis=1)
+    assigned = [[] for _ in range(len(boxes))]
+    for word, box_index, best_overlap in zip(words, best_box, overlap.max(axis=1)):
+        if best_overlap >= min_overlap:
+            assigned[box_index].append(word)
+    return [' '.join(box_words) for box_words in assigned]
+
+# Function to OCR a whole image once with Tesseract's word-box output and assign words to the text boxes
+def ocr_words_in_boxes(image, boxes, upscale=2, psm=11, min_overlap=0.5):
+    if len(boxes) == 0:
+        return []
+    if upscale != 1:
+        image = cv2.resize(image, (image.shape[1] * upscale, image.shape[0] * upscale))
+    data = pytesseract.image_to_data(image, config=f'--psm {psm}', output_type=pytesseract.Output.DICT)
+
+    # Keep recognised words only, mapping their boxes back to the original image scale
+    words = []
+    word_boxes = []
+    for text, conf, left, top, width, height in zip(data['text'], data['conf'], data['left'], data['top'], data['width'], data['height']):
+        if text.strip() and float(conf) >= 0:
+            words.append(text.strip())
+            word_boxes.append((left / upscale, top / upscale, (left + width) / upscale, (top + height) / upscale))
+
+    return assign_words_to_boxes(word_boxes, words, boxes, min_overlap)
+
+# OCR engine running Tesseract over many ROIs in parallel
+class OCREngine:
+    def __init__(self, workers=4, executor='thread', max_pending=None, upscale=4, psm=12, mode='roi', page_upscale=2, page_psm=11):
+        self.workers = max(1, int(workers))
+        self.executor = executor
+        self.max_pending = max_pending or self.workers * 4
+        self.upscale = upscale
+        self.psm = psm
+
+        # 'roi' runs one tesseract call per text box, 'page' runs one call per image and assigns words to boxes
+        if mode not in ('roi', 'page'):
+            raise ValueError(f"Unknown OCR mode: {mode}. Expected 'roi' or 'page'.")
+        self.mode = mode
+        self.page_upscale = page_upscale
+        self.page_psm = page_psm
+
+        # Each pytesseract call runs in its own tesseract subprocess, so threads parallelise well;
+        # a process pool is available for hosts where the Python side becomes the bottleneck
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        self._pool = pool_class(max_workers=self.workers, initializer=_init_worker,
+                                initargs=(pytesseract.pytesseract.tesseract_cmd,))
+
+    # Create an engine from the ocr section of configs/config.yaml
+    @classmethod
+    def from_config(cls, config=None):
+        ocr_config = get_config_section('ocr', config)
+        return cls(
+            workers=ocr_config.get('workers', 4),
+            executor=ocr_config.get('executor', 'thread'),
+            max_pending=ocr_config.get('max_pending'),
+            upscale=ocr_config.get('upscale', 4),
+            psm=ocr_config.get('psm', 12),
+            mode=ocr_config.get('mode', 'roi'),
+            page_upscale=ocr_config.get('page_upscale', 2),
+            page_psm=ocr_config.get('page_psm', 11),
+        )
+
+    # Settings that change OCR output, used to key cached OCR results
+    def cache_params(self):
+        if self.mode == 'page':
+            return {'mode': self.mode, 'upscale': self.page_upscale, 'psm': self.page_psm}
+        return {'mode': self.mode, 'upscale': self.upscale, 'psm': self.psm}
+
+    # Submit fn over an iterable of argument tuples, returning results in input order with at most max_pending in flight
+    def _map_ordered(self, fn, arg_tuples):
+        results = []
+        pending = deque()
+        for args in arg_tuples:
+            if len(pending) >= self.max_pending:
+                results.append(pending.popleft().result())
+            pending.append(self._pool.submit(fn, *args))
+        while pending:
+            results.append(pending.popleft().result())
+        return results
+
+    # Recognise an iterable of ROIs, returning texts in input order with at most max_pending ROIs in flight
+    def recognise(self, rois):
+        return self._map_ordered(ocr_roi, ((roi, self.upscale, self.psm) for roi in rois))
+
+    # Recognise the text boxes of several images, returning one list of texts per image
+    def recognise_regions(self, images, boxes_per_image):
+        if self.mode == 'page':
+            # One tesseract call per image instead of one per box
+            return self._map_ordered(ocr_words_in_boxes, ((image, boxes, self.page_upscale, self.page_psm) for image, boxes in zip(images, boxes_per_image)))
+
+        # Fan every ROI of every image out together so the pool stays busy across image boundaries
+        rois = (image[startY:endY, startX:endX] for image, boxes in zip(images, boxes_per_image) for (startX, startY, endX, endY) in boxes)
+        texts = iter(self.recognise(rois))
+        return [[next(texts) for _ in boxes] for boxes in boxes_per_image]
+
+    # Shut down the worker pool
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Shared engine used when a detector is created without one
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+# Function to get the shared default OCR engine, creating it from config on first use
+def get_default_ocr_engine():
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = OCREngine.from_config()
+    return _default_engine
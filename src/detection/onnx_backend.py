@@ -0,0 +1,165 @@
+# Description: ONNX Runtime inference backend for the YOLOv5 and EAST models on CPU fleets. Both models are exported
+# to ONNX once and run in ONNX Runtime sessions with configurable intra/inter-op threads and execution providers
+# (e.g. OpenVINOExecutionProvider from onnxruntime-openvino). Each wrapper keeps the interface of the model it
+# replaces, so the detection code runs unchanged on either backend.
+# Import necessary libraries
+import ast
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+
+from src.postprocessing.page_aggregation import non_max_suppression
+from src.utils.result_cache import hash_file
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Input and output tensors of the frozen EAST graph
+EAST_INPUT_NAME = 'input_images:0'
+EAST_OUTPUT_NAMES = ['feature_fusion/Conv_7/Sigmoid:0', 'feature_fusion/concat_3:0']
+
+# Loaded ONNX models, keyed by (model hash, session settings) so each is loaded once per process
+_onnx_models = {}
+_onnx_models_lock = threading.Lock()
+
+# Function to get the path of the ONNX export that sits next to a weights or graph file; the INT8 model written by
+# src.detection.quantization sits beside it as <name>.int8.onnx
+def onnx_path_for(model_path, precision='fp32'):
+    return os.path.splitext(model_path)[0] + ('.int8.onnx' if precision == 'int8' else '.onnx')
+
+# Function to create an ONNX Runtime session with the threading and providers of the onnxruntime config section
+def create_session(onnx_path, onnx_config=None):
+    if ort is None:
+        raise ImportError("onnxruntime is not installed. Install it with `pip install onnxruntime` to use the onnxruntime backend.")
+    if not os.path.exists(onnx_path):
+        raise FileNotFoundError(f"ONNX model not found: {onnx_path}. Export it first (see export_yolo_onnx / export_east_onnx).")
+    onnx_config = onnx_config or {}
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(onnx_config.get('intra_op_threads', 0))
+    options.inter_op_num_threads = int(onnx_config.get('inter_op_threads', 0))
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    available = ort.get_available_providers()
+    providers = [provider for provider in onnx_config.get('providers', ['CPUExecutionProvider']) if provider in available]
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=providers or ['CPUExecutionProvider'])
+
+# Function to load an ONNX model wrapper once per process, reporting the load time
+def _load_cached(model_class, onnx_path, onnx_config):
+    model_hash = hash_file(onnx_path)
+    key = (model_class.__name__, model_hash, repr(sorted((onnx_config or {}).items())))
+    with _onnx_models_lock:
+        model = _onnx_models.get(key)
+        if model is None:
+            start_time = time.perf_counter()
+            model = model_class(onnx_path, onnx_config)
+            model.weights_hash = model_hash
+            _onnx_models[key] = model
+            print(f"Loaded ONNX model {os.path.basename(onnx_path)} in {time.perf_counter() - start_time:.2f}s")
+    return model
+
+# Function to resize and pad an RGB image to a square input the way YOLOv5 letterboxes, returning (image, gain, pad)
+def letterbox(image, size, color=114):
+    (h, w) = image.shape[:2]
+    gain = min(size / h, size / w)
+    (new_w, new_h) = (int(round(w * gain)), int(round(h * gain)))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    (pad_x, pad_y) = ((size - new_w) / 2, (size - new_h) / 2)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    if top or bottom or left or right:
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(color, color, color))
+    return image, gain, (left, top)
+
+# YOLOv5 exported to ONNX, called like the hub model: a list of PIL images or RGB arrays in, one (N, 6)
+# [x0, y0, x1, y1, confidence, class] array per image out, after the same confidence filter and per-class NMS
+class OnnxYoloModel:
+    def __init__(self, onnx_path, onnx_config=None, conf=0.25, iou=0.45, max_det=1000):
+        self.session = create_session(onnx_path, onnx_config)
+        self.input_name = self.session.get_inputs()[0].name
+        input_shape = self.session.get_inputs()[0].shape
+        # A static export fixes the input size and batch; a dynamic one takes any batch at yolo_img_size, which
+        # defaults to the hub model's inference size so both backends see the same input
+        img_size = (onnx_config or {}).get('yolo_img_size', 640)
+        self.img_size = input_shape[2] if isinstance(input_shape[2], int) else img_size
+        self.fixed_batch = input_shape[0] if isinstance(input_shape[0], int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    # Decode one image's raw predictions into filtered, NMS-suppressed detections in original image coordinates
+    def _postprocess(self, prediction, gain, pad, shape):
+        scores = prediction[:, 5:] * prediction[:, 4:5]
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+        keep = (prediction[:, 4] > self.conf) & (confidences > self.conf)
+        (xywh, confidences, classes) = (prediction[keep, :4], confidences[keep], classes[keep])
+        boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        keep = non_max_suppression(boxes, confidences, self.iou, classes)[:self.max_det]
+        (boxes, confidences, classes) = (boxes[keep], confidences[keep], classes[keep])
+
+        # Undo the letterbox and clip to the image
+        boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+        return np.concatenate([boxes, confidences[:, None], classes[:, None]], axis=1).astype(np.float32)
+
+    def __call__(self, images):
+        images = images if isinstance(images, list) else [images]
+        arrays = [np.asarray(image.convert('RGB') if hasattr(image, 'convert') else image) for image in images]
+        letterboxed = [letterbox(array, self.img_size) for array in arrays]
+        blob = np.stack([image for image, _, _ in letterboxed]).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+
+        # Static exports run one fixed-size batch at a time
+        step = self.fixed_batch or len(blob)
+        predictions = np.concatenate([self.session.run(None, {self.input_name: blob[k:k + step]})[0]
+                                      for k in range(0, len(blob), step)])
+        xyxy = [self._postprocess(prediction, gain, pad, array.shape)
+                for prediction, (_, gain, pad), array in zip(predictions, letterboxed, arrays)]
+        return SimpleNamespace(xyxy=xyxy)
+
+# EAST exported to ONNX behind the setInput/forward interface of an OpenCV DNN net, taking the same NCHW blob and
+# returning the same NCHW score and geometry maps
+class OnnxEASTNet:
+    def __init__(self, onnx_path, onnx_config=None):
+        self.session = create_session(onnx_path, onnx_config)
+        self.model_path = onnx_path
+        self._blob = None
+
+    def setInput(self, blob):
+        self._blob = blob
+
+    def forward(self, layer_names=None):
+        # The TensorFlow graph is NHWC
+        (scores, geometry) = self.session.run(EAST_OUTPUT_NAMES, {EAST_INPUT_NAME: self._blob.transpose(0, 2, 3, 1)})
+        return scores.transpose(0, 3, 1, 2), geometry.transpose(0, 3, 1, 2)
+
+# Function to load YOLOv5 weights exported to ONNX
+def load_onnx_yolo(onnx_path, onnx_config=None):
+    return _load_cached(OnnxYoloModel, onnx_path, onnx_config)
+
+# Function to load the EAST graph exported to ONNX
+def load_onnx_east(onnx_path, onnx_config=None):
+    return _load_cached(OnnxEASTNet, onnx_path, onnx_config)
+
+# Function to export the frozen EAST graph to ONNX next to the .pb file (needs tensorflow and tf2onnx)
+def export_east_onnx(model_path, opset=13):
+    onnx_path = onnx_path_for(model_path)
+    export_cmd = [sys.executable, '-m', 'tf2onnx.convert', '--graphdef', model_path, '--output', onnx_path, '--opset', str(opset),
+                  '--inputs', EAST_INPUT_NAME, '--outputs', ','.join(EAST_OUTPUT_NAMES)]
+    print(f"Exporting EAST graph...\nCommand: {' '.join(export_cmd)}")
+    subprocess.run(export_cmd, check=True)
+    return onnx_path
+
+# Function to export trained YOLOv5 weights to ONNX next to the .pt file, with a dynamic batch axis
+def export_yolo_onnx(model_path, img_size=448):
+    from src.detection.yolo_object_detection import export_weights
+    return export_weights(model_path, formats=('onnx',), img_size=img_size)[0]
@@ -1,7 +1,8 @@
 # Import the necessary packages
 import os
 import cv2
-import numpy as np
+
+from src.detection.east_decoding import decode_predictions
 
 # Function to load image paths from a directory
 def load_image_paths(directory):
@@ -29,39 +30,7 @@ def process_image(image_path, net, newW=448, newH=448):
     (scores, geometry) = net.forward(layerNames)
 
     # Get the rectangles
-    (numRows, numCols) = scores.shape[2:4]
-    rects = []
-    confidences = []
-
-    for y in range(numRows):
-        scoresData = scores[0, 0, y]
-        xData0 = geometry[0, 0, y]
-        xData1 = geometry[0, 1, y]
-        xData2 = geometry[0, 2, y]
-        xData3 = geometry[0, 3, y]
-        anglesData = geometry[0, 4, y]
-
-        for x in range(numCols):
-            if scoresData[x] < 0.5:
-                continue
-
-            offsetX = x * 4.0
-            offsetY = y * 4.0
-
-            angle = anglesData[x]
-            cos = np.cos(angle)
-            sin = np.sin(angle)
-
-            h = xData0[x] + xData2[x]
-            w = xData1[x] + xData3[x]
-
-            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
-            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
-            startX = int(endX - w)
-            startY = int(endY - h)
-
-            rects.append((startX, startY, endX, endY))
-            confidences.append(scoresData[x])
+    rects, confidences = decode_predictions(scores, geometry, 0.5)
 
     # Apply non-maxima suppression
     indices = cv2.dnn.NMSBoxes(rects, confidences, 0.5, 0.4)
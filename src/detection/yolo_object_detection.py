@@ -3,26 +3,111 @@
 import torch
 import os
 import csv
+import json
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+import numpy as np
 from PIL import Image, ImageDraw
 
+from src.utils.config import PROJECT_ROOT, get_config_section, resolve_path
+from src.utils.result_cache import StageCache, hash_array, hash_file
+
+# Ultralytics YOLOv5 checkout the models are built from, so loading needs neither torch.hub nor network access
+YOLOV5_DIR = os.path.join(PROJECT_ROOT, 'yolov5')
+
+# File suffixes of the weight formats the loader accepts; exported artifacts sit next to best.pt
+WEIGHT_SUFFIXES = {'pt': '.pt', 'torchscript': '.torchscript', 'onnx': '.onnx'}
+
+# Loaded YOLOv5 models, keyed by (weights hash, device) so each is built once per process
+_yolo_models = {}
+_yolo_models_lock = threading.Lock()
+
+# Function to pick the exported artifact of a weights file in the preferred format, if one exists and is up to date.
+def resolve_weights(model_path, weights_format='pt'):
+    if weights_format not in WEIGHT_SUFFIXES:
+        raise ValueError(f"Unknown weights format: {weights_format}. Expected one of {', '.join(WEIGHT_SUFFIXES)}.")
+    artifact_path = os.path.splitext(model_path)[0] + WEIGHT_SUFFIXES[weights_format]
+    if artifact_path == model_path:
+        return model_path
+    if os.path.exists(artifact_path) and (not os.path.exists(model_path) or os.path.getmtime(artifact_path) >= os.path.getmtime(model_path)):
+        return artifact_path
+    print(f"No up-to-date {weights_format} export of {model_path}, loading the PyTorch weights instead.")
+    return model_path
+
+# Function to build a YOLOv5 model from the local checkout, wrapped for PIL/array input and NMS like the hub model.
+def _build_model(model_path, repo_dir, device):
+    if not os.path.isdir(repo_dir):
+        print(f"YOLOv5 checkout not found at {repo_dir}, loading through torch.hub instead.")
+        return torch.hub.load('ultralytics/yolov5', 'custom', path=model_path)
+
+    # The checkout's modules are imported by their own top-level names, which .pt checkpoints also refer to
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+    from models.common import AutoShape, DetectMultiBackend
+    from utils.torch_utils import select_device
+
+    # DetectMultiBackend reads .pt, TorchScript and ONNX weights alike, as the hub 'custom' entry point does
+    return AutoShape(DetectMultiBackend(model_path, device=select_device(device), fuse=True))
+
 # Function to load the YOLOv5 model.
-def load_model(model_path):
-    # Load the YOLOv5 model from the given path.
-    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path)
+def load_model(model_path, repo_dir=YOLOV5_DIR, device=''):
+    # Load the YOLOv5 model from the given path, reusing a model already built from the same weights.
+    weights_hash = hash_file(model_path)
+    key = (weights_hash, device)
+    with _yolo_models_lock:
+        model = _yolo_models.get(key)
+        if model is None:
+            start_time = time.perf_counter()
+            model = _build_model(model_path, repo_dir, device)
+            model.weights_hash = weights_hash
+            if model_path.endswith(WEIGHT_SUFFIXES['torchscript']):
+                model.fixed_batch_size = exported_batch_size(model_path)
+            _yolo_models[key] = model
+            print(f"Loaded YOLOv5 model {os.path.basename(model_path)} in {time.perf_counter() - start_time:.2f}s")
     return model
 
-# Function to detect objects in an image.
-def detect_objects(image_path, model):
-    # Load the image.
-    img = Image.open(image_path)
-    results = model(img)
-
-    class_names = model.names  # Assuming YOLO model has names attribute for class names
-
+# Function to load the YOLOv5 model as set in the object_detection section of configs/config.yaml.
+def load_model_from_config(model_path, config=None):
+    object_config = get_config_section('object_detection', config)
+    if object_config.get('backend', 'torch') == 'onnxruntime':
+        from src.detection.onnx_backend import load_onnx_yolo, onnx_path_for
+        onnx_config = get_config_section('onnxruntime', config)
+        onnx_path = model_path if model_path.endswith('.onnx') else onnx_path_for(model_path, onnx_config.get('precision', 'fp32'))
+        return load_onnx_yolo(onnx_path, onnx_config)
+    weights_path = resolve_weights(model_path, object_config.get('weights_format', 'pt'))
+    return load_model(weights_path, resolve_path(object_config.get('yolov5_dir', './yolov5')), object_config.get('device', ''))
+
+# Function to read the batch size a TorchScript export was traced at from the input shape export.py stores with it.
+def exported_batch_size(model_path):
+    with zipfile.ZipFile(model_path) as archive:
+        config_name = next((name for name in archive.namelist() if name.endswith('extra/config.txt')), None)
+        if config_name is None:
+            return None
+        return int(json.loads(archive.read(config_name))['shape'][0])
+
+# Function to export YOLOv5 weights to TorchScript and/or ONNX next to the .pt file, for faster cold starts.
+def export_weights(model_path, formats=('torchscript', 'onnx'), img_size=448, batch_size=32, repo_dir=YOLOV5_DIR):
+    export_cmd = [sys.executable, os.path.join(repo_dir, 'export.py'), '--weights', model_path,
+                  '--include', *formats, '--imgsz', str(img_size)]
+    if 'torchscript' in formats:
+        # TorchScript is traced at a fixed batch size, so it is exported at the batch size detection runs with
+        export_cmd += ['--batch-size', str(batch_size)]
+    if 'onnx' in formats:
+        # A dynamic batch axis lets one ONNX artifact serve every batch size
+        export_cmd.append('--dynamic')
+    print(f"Exporting YOLOv5 weights...\nCommand: {' '.join(export_cmd)}")
+    subprocess.run(export_cmd, check=True)
+    return [os.path.splitext(model_path)[0] + WEIGHT_SUFFIXES[weights_format] for weights_format in formats]
+
+# Function to convert one image's YOLOv5 detections into box dictionaries.
+def boxes_from_detections(image_filename, detections, class_names):
     boxes = []
-    for *xyxy, conf, cls in results.xyxy[0]:
+    for *xyxy, conf, cls in detections:
         box = {
-            'image_filename': os.path.basename(image_path),
+            'image_filename': image_filename,
             'bbox_type': 'YOLOv5',
             'bbox_coordinates': xyxy,
             'confidence_score': conf.item(),
@@ -32,6 +117,71 @@ def detect_objects(image_path, model):
         boxes.append(box)
     return boxes
 
+# Function to detect objects in an image.
+def detect_objects(image_path, model):
+    # Load the image.
+    img = Image.open(image_path)
+    results = model(img)
+
+    class_names = model.names  # Assuming YOLO model has names attribute for class names
+    return boxes_from_detections(os.path.basename(image_path), results.xyxy[0], class_names)
+
+# Function to run the model over already loaded images, batch_size images per forward pass.
+def _detect_in_batches(images, image_filenames, model, batch_size):
+    # A TorchScript export only accepts the batch size it was traced at, so short batches are padded up to it
+    fixed_batch_size = getattr(model, 'fixed_batch_size', None)
+    if fixed_batch_size:
+        batch_size = fixed_batch_size
+    boxes_dict = {}
+    for start in range(0, len(images), batch_size):
+        batch = list(images[start:start + batch_size])
+        if fixed_batch_size:
+            batch += [batch[-1]] * (fixed_batch_size - len(batch))
+        # The hub model accepts a list of images and returns one xyxy tensor per image, in order
+        results = model(batch)
+        for k, image_filename in enumerate(image_filenames[start:start + batch_size]):
+            boxes_dict[image_filename] = boxes_from_detections(image_filename, results.xyxy[k], model.names)
+    return boxes_dict
+
+# Function to create the result cache view for a YOLOv5 model, keyed by its weights and thresholds.
+def create_object_cache(result_cache, model, model_path):
+    if result_cache is None:
+        return None
+    params = {'conf': getattr(model, 'conf', None), 'iou': getattr(model, 'iou', None)}
+    # Loaded and remote models carry the hash of the weights they were built from (an export differs from best.pt)
+    weights_hash = getattr(model, 'weights_hash', None) or hash_file(model_path)
+    return StageCache(result_cache, 'yolo', weights_hash, params)
+
+# Function to detect objects in already loaded images (PIL images or RGB arrays), batch_size images per forward pass.
+def detect_objects_in_images(images, image_filenames, model, batch_size=32, cache=None):
+    if cache is None:
+        return _detect_in_batches(images, image_filenames, model, batch_size)
+
+    # Look every image up by content; only the cache misses go through the model
+    def detect_misses(misses):
+        detected = _detect_in_batches([images[k] for k in misses], [image_filenames[k] for k in misses], model, batch_size)
+        # Cached boxes hold plain floats and no filename, since the same content may appear under another name
+        return [
+            [{**{name: value for name, value in box.items() if name != 'image_filename'},
+              'bbox_coordinates': [float(c) for c in box['bbox_coordinates']]}
+             for box in detected[image_filenames[k]]]
+            for k in misses
+        ]
+
+    keys = [cache.key(hash_array(np.asarray(image))) for image in images]
+    results = cache.get_or_compute(keys, detect_misses)
+    return {image_filename: [dict(box, image_filename=image_filename) for box in boxes]
+            for image_filename, boxes in zip(image_filenames, results)}
+
+# Function to detect objects in a list of image files, loading and running batch_size images at a time.
+def detect_objects_batch(image_paths, model, batch_size=32, cache=None):
+    boxes_dict = {}
+    for start in range(0, len(image_paths), batch_size):
+        chunk = image_paths[start:start + batch_size]
+        images = [Image.open(image_path) for image_path in chunk]
+        boxes_dict.update(detect_objects_in_images(images, [os.path.basename(p) for p in chunk], model, batch_size, cache))
+    return boxes_dict
+
 # Function to draw bounding boxes on the image.
 def draw_boxes(image_path, boxes, output_path):
     # Draw bounding boxes on the image and save it.
@@ -43,26 +193,23 @@ def draw_boxes(image_path, boxes, output_path):
     img.save(output_path)
 
 # Function to detect objects in image patches and draw bounding boxes.
-def detect_objects_and_draw_boxes(patches_dir, output_dir, model):
+def detect_objects_and_draw_boxes(patches_dir, output_dir, model, batch_size=32):
     # Detect objects in image patches and draw bounding boxes.
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     image_files = [f for f in os.listdir(patches_dir) if os.path.isfile(os.path.join(patches_dir, f))]
-    boxes_dict = {}
+    boxes_dict = detect_objects_batch([os.path.join(patches_dir, f) for f in image_files], model, batch_size)
 
     for image_file in image_files:
         image_path = os.path.join(patches_dir, image_file)
-        boxes = detect_objects(image_path, model)
-        boxes_dict[image_file] = boxes
-
         output_path = os.path.join(output_dir, image_file)
-        draw_boxes(image_path, boxes, output_path)
+        draw_boxes(image_path, boxes_dict[image_file], output_path)
 
     return boxes_dict
 
 # Function to detect objects in image patches and save bounding box info to CSV.
-def detect_objects_and_save_to_csv(patches_dir, output_dir, model):
+def detect_objects_and_save_to_csv(patches_dir, output_dir, model, batch_size=32):
     # Create output directory if it doesn't exist (optional, if not already done)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -75,10 +222,9 @@ def detect_objects_and_save_to_csv(patches_dir, output_dir, model):
         writer.writeheader()
 
         image_files = [f for f in os.listdir(patches_dir) if os.path.isfile(os.path.join(patches_dir, f))]
+        boxes_dict = detect_objects_batch([os.path.join(patches_dir, f) for f in image_files], model, batch_size)
 
         for image_file in image_files:
-            image_path = os.path.join(patches_dir, image_file)
-            boxes = detect_objects(image_path, model)
-
-            for box in boxes:
-                writer.writerow(box)
\ No newline at end of file
+            for box in boxes_dict[image_file]:
+                # Plain float coordinates rather than stringified tensors
+                writer.writerow(dict(box, bbox_coordinates=[float(c) for c in box['bbox_coordinates']]))
\ No newline at end of file
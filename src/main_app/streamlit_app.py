@@ -10,15 +10,29 @@ import glob
 import sys
 
 # Import custom scripts
-from src.detection.yolo_object_detection import detect_objects_and_draw_boxes, detect_objects, load_model
-from src.detection.east_text_detector import detect_text
-from src.postprocessing.text_extraction import process_text_files
+from src.detection.yolo_object_detection import detect_objects, load_model_from_config, create_object_cache
+from src.detection.east_text_detector import EASTTextDetector
+from src.detection.ocr_engine import OCREngine
+from src.postprocessing.text_extraction import consolidate_text
 from src.postprocessing.image_deconstruction import slice_images
 from src.postprocessing.image_reconstruction import reconstruct_images
+from src.postprocessing.page_aggregation import aggregate_object_boxes
+from src.postprocessing.overlays import LAYER_STYLES, load_geojson, render_overlay_preview
+from src.postprocessing.spatial_index import association_table
+from src.pipeline.inference_server import RemoteObjectModel, RemoteTextDetector, open_inference_client
+from src.pipeline.manifest import PipelineManifest, prune_drawings
+from src.pipeline.page_pipeline import process_pages, detect_patches_concurrently, record_disk_outputs
+from src.utils.config import get_config_section
+from src.utils.detections_store import open_detections_store
+from src.utils.page_store import open_page_store
+from src.utils.result_cache import open_result_cache
 
 # Switch between full Dataset or Demo mode
 demo_mode = True
 
+# Streaming mode tiles pages in memory and only writes final artifacts; otherwise patches round-trip through disk
+streaming_mode = True
+
 # Base source directory
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Dataset'))
 
@@ -34,6 +48,9 @@ object_detection_dir = os.path.join(source_dir, 'ObjectDetection')
 text_detection_dir = os.path.join(source_dir, 'TextDetection')
 output_dir = os.path.join(source_dir, 'Output')
 
+# Manifest of processed drawings, so each run only processes new or modified drawings
+manifest = PipelineManifest(os.path.join(source_dir, 'pipeline_manifest.json'))
+
 # Get the most recent training run directory for YOLOv5 model
 runs_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'yolov5', 'runs', 'train'))
 run_dirs = sorted(glob.glob(os.path.join(runs_dir, 'exp*')), key=os.path.getmtime, reverse=True)
@@ -43,63 +60,140 @@ if run_dirs:
 else:
     raise FileNotFoundError("No YOLOv5 training runs found. Please train the model first.")
 
-model = load_model(model_path)
+# Detection runs in the resident inference server when one is configured, so app processes share one warm model;
+# otherwise the model is loaded once per server process and shared across reruns and sessions
+@st.cache_resource
+def get_inference_client():
+    return open_inference_client(get_config_section('inference_server'))
+
+inference_client = get_inference_client()
+
+@st.cache_resource
+def get_model(model_path):
+    if inference_client is not None:
+        return RemoteObjectModel(inference_client)
+    return load_model_from_config(model_path)
+
+model = get_model(model_path)
+
+# Open the persistent result cache once per server process, so results survive new sessions and restarts
+@st.cache_resource
+def get_result_cache():
+    return open_result_cache(get_config_section('cache'))
+
+result_cache = get_result_cache()
+object_cache = create_object_cache(result_cache, model, model_path)
 
 # Load the pre-trained EAST text detection model
 text_model_path = r"C:\Users\Stuart\Python\PID_MLOPS\digitised-pid-mlops\src\detection\models\frozen_east_text_detection.pb"
 print("File exists:", os.path.exists(text_model_path))
 
+# Load the EAST network once per server process and share it across reruns and sessions
+@st.cache_resource
+def get_text_detector(model_path):
+    if inference_client is not None:
+        return RemoteTextDetector.from_server(inference_client, ocr_engine=OCREngine.from_config(), result_cache=result_cache)
+    return EASTTextDetector.from_config(model_path, ocr_engine=OCREngine.from_config(), result_cache=result_cache)
+
+text_detector = get_text_detector(text_model_path)
+
 # Streamlit app
 st.title('P&ID Image Processing Application')
 st.subheader('Carries out object detection, text detection & extraction')
 st.subheader('Reconstruction of Images with Bounding Boxes')
 st.subheader('Displays count of objects and extracted text for each image, and provides download option for consolidated extracted text CSV.')
 
-# Step 1: Slice the original image into patches
-if not os.path.exists(patches_dir) or not os.listdir(patches_dir):
-    st.subheader("Step 1: Slicing images into patches")
-    slice_images(image_dir, patches_dir)
+object_batch_size = get_config_section('object_detection').get('batch_size', 32)
+tile_filter_config = get_config_section('tile_filter')
+min_ink_fraction = tile_filter_config.get('min_ink_fraction', 0.002)
+ink_threshold = tile_filter_config.get('ink_threshold', 160)
+
+# Very large pages are memory-mapped through the page store instead of being loaded into RAM
+page_store_config = get_config_section('page_store')
+page_store = open_page_store(page_store_config)
+
+# Detections are kept as GeoJSON/SVG overlay layers drawn over the original image; burn_in also renders annotated JPEGs
+burn_in = get_config_section('overlays').get('burn_in', False)
+
+# Detections of the run go to one Parquet dataset partitioned by drawing instead of per-patch CSV and TXT files
+detections_store = open_detections_store(get_config_section('detections_store'), os.path.join(source_dir, 'Detections'))
+
+# Steps 1-4 in streaming mode: tile, detect and annotate each page in memory
+if streaming_mode and 'reconstructed_image_paths' not in st.session_state:
+    st.subheader("Steps 1-4: Tiling, detecting and annotating each page in memory")
+    object_boxes, extracted_texts, output_paths, skipped_tiles = process_pages(
+        image_dir, model, text_detector, text_detection_dir, output_dir, batch_size=object_batch_size,
+        min_ink_fraction=min_ink_fraction, ink_threshold=ink_threshold, object_cache=object_cache, manifest=manifest,
+        page_store=page_store, burn_in=burn_in, detections_store=detections_store
+    )
+    st.write(f"Skipped {skipped_tiles} blank tiles")
+    st.session_state.object_boxes = object_boxes
+    st.session_state.extracted_texts = extracted_texts
+    st.session_state.reconstructed_image_paths = sorted(p for p in output_paths if p.endswith('.jpg' if burn_in else '.geojson'))
 
-# Step 2: Perform object detection on patches and draw bounding boxes
-if 'object_boxes' not in st.session_state:
-    st.subheader("Step 2: Performing object detection on patches")
-    st.session_state.object_boxes = detect_objects_and_draw_boxes(patches_dir, object_detection_dir, model)
+# Step 1: Slice new or modified images into patches and prune the outputs of removed or modified ones
+if not streaming_mode and 'object_boxes' not in st.session_state:
+    plan = manifest.plan(image_dir)
+    prune_drawings(manifest, plan)
+    if plan.new or plan.modified:
+        st.subheader("Step 1: Slicing images into patches")
+        skipped_tiles, patch_paths_by_image = slice_images(
+            image_dir, patches_dir, min_ink_fraction=min_ink_fraction, ink_threshold=ink_threshold, filenames=plan.new + plan.modified,
+            page_store=page_store
+        )
+        for filename, patch_paths in patch_paths_by_image.items():
+            manifest.record_source(filename, os.path.join(image_dir, filename), [os.path.basename(p) for p in patch_paths])
+            manifest.record_stage(filename, 'slicing', patch_paths)
+        manifest.save()
+        st.write(f"Sliced {len(patch_paths_by_image)} new or modified images, skipped {skipped_tiles} blank tiles")
+
+# Steps 2-3: Object and text detection both read the original patches and run concurrently;
+# the boxes are exported as overlay layers per drawing (and, with burn_in, composited onto each patch for reconstruction)
+if 'object_boxes' not in st.session_state or 'extracted_texts' not in st.session_state:
+    st.subheader("Steps 2-3: Performing object and text detection on patches")
+    object_boxes, extracted_texts = detect_patches_concurrently(
+        patches_dir, model, text_detector, text_detection_dir, batch_size=object_batch_size, object_cache=object_cache,
+        output_dir=output_dir, burn_in=burn_in, detections_store=detections_store
+    )
+    st.session_state.object_boxes = object_boxes
+    st.session_state.extracted_texts = extracted_texts
 object_boxes = st.session_state.object_boxes
+extracted_texts = st.session_state.extracted_texts
+
+# Merge patch detections into one deduplicated set per drawing so symbols on patch seams are counted once
+if 'page_detections' not in st.session_state:
+    st.session_state.page_detections = aggregate_object_boxes(object_boxes)
+page_detections = st.session_state.page_detections
 
 # Function to get counts of symbols for a specific image
 def get_symbol_counts_for_image(image_filename):
     counts = {}
-    for patch_filename, boxes in object_boxes.items():
-        if patch_filename.startswith(image_filename):
-            for box in boxes:
-                class_name = box['class_name']
-                if class_name in counts:
-                    counts[class_name] += 1
-                else:
-                    counts[class_name] = 1
+    for box in page_detections.get(image_filename, []):
+        class_name = box['class_name']
+        if class_name in counts:
+            counts[class_name] += 1
+        else:
+            counts[class_name] = 1
     return counts
 
-# Step 3: Text detection on patches, draw bounding boxes on the patches with objects and extract text
-if 'extracted_texts' not in st.session_state:
-    st.subheader("Step 3: Performing text detection on patches")
-    extracted_texts = []
-    for filename in os.listdir(object_detection_dir):
-        if filename.endswith(".jpg"):
-            image_path = os.path.join(object_detection_dir, filename)
-            patch_id = os.path.splitext(filename)[0]  # Assuming patch_id is based on filename without extension
-            texts, csv_filepath = detect_text(image_path, text_model_path, text_detection_dir, patch_id)
-            extracted_texts.extend(texts)
-    st.session_state.extracted_texts = extracted_texts
-else:
-    extracted_texts = st.session_state.extracted_texts
+# Without burn_in there is nothing to reconstruct: each drawing is viewed as its original image plus overlay layers
+if 'reconstructed_image_paths' not in st.session_state and not burn_in:
+    st.session_state.reconstructed_image_paths = sorted(glob.glob(os.path.join(output_dir, 'overlays_*.geojson')))
+    record_disk_outputs(manifest, text_detection_dir, output_dir, detections_store)
 
 # Step 4: Reconstruct the original image from the patches that have the bounding boxes already overlayed
 if 'reconstructed_image_paths' not in st.session_state:
     st.subheader("Step 4: Reconstructing the original image from patches")
-    reconstructed_image_dir = reconstruct_images(text_detection_dir, output_dir)
+    reconstruction_config = get_config_section('reconstruction')
+    reconstructed_image_dir = reconstruct_images(
+        text_detection_dir, output_dir, page_store=page_store,
+        workers=reconstruction_config.get('workers', 4), decode_workers=reconstruction_config.get('decode_workers', 8)
+    )
     if reconstructed_image_dir:
         reconstructed_image_paths = sorted(glob.glob(os.path.join(reconstructed_image_dir, '*.jpg')))
         st.session_state.reconstructed_image_paths = reconstructed_image_paths
+        if not streaming_mode:
+            record_disk_outputs(manifest, text_detection_dir, output_dir, detections_store)
     else:
         st.error("Failed to reconstruct the images.")
         reconstructed_image_paths = None
@@ -109,22 +203,41 @@ else:
 # Select an image to view
 selected_image_path = st.selectbox('Select Image', reconstructed_image_paths, index=0) if reconstructed_image_paths else None
 
-# Function to extract original filename from reconstructed image filename
+# Function to extract original filename from reconstructed image or overlay filename
 def extract_original_filename(filename):
-    match = re.search(r'reconstructed_(.+)\.jpg', filename)
+    match = re.search(r'(?:reconstructed|overlays)_(.+)\.(?:jpg|geojson)', filename)
     if match:
         return match.group(1)
     else:
         return None
 
+# Function to draw the selected overlay layers over the original image; cached per overlay file and modification time
+# so toggling layers needs no recomputation and re-processed drawings are redrawn
+@st.cache_data
+def render_overlay_view(overlay_path, image_path, visible_layers, modified_time):
+    layers, _, _ = load_geojson(overlay_path)
+    return render_overlay_preview(image_path, layers, visible_layers, page_store, page_store_config.get('preview_size', 4096))
+
+# Function to pair each symbol of a drawing with its nearest tag; cached per overlay file and modification time
+@st.cache_data
+def get_symbol_tags(drawing, overlay_path, modified_time):
+    layers, _, _ = load_geojson(overlay_path)
+    return association_table(drawing, layers, **get_config_section('tag_association'))
+
 # Step 5: Display extracted text and identified symbols for the selected image
 if selected_image_path:
-    st.image(Image.open(selected_image_path), caption='Selected Image', use_container_width=True)
-    
-    # Process text files and get the DataFrame for selected image
-    df = process_text_files(text_detection_dir)
-    
     original_filename = extract_original_filename(os.path.basename(selected_image_path))
+    if selected_image_path.endswith('.geojson'):
+        visible_layers = st.multiselect('Overlay layers', list(LAYER_STYLES), default=list(LAYER_STYLES))
+        original_image_path = os.path.join(image_dir, f"{original_filename}.jpg")
+        st.image(render_overlay_view(selected_image_path, original_image_path, tuple(visible_layers), os.path.getmtime(selected_image_path)), caption='Selected Image', use_container_width=True)
+    else:
+        st.image(Image.open(selected_image_path), caption='Selected Image', use_container_width=True)
+    
+    # Consolidate the extracted text once per session; changing the selected image only filters the cached table
+    if 'consolidated_text' not in st.session_state:
+        st.session_state.consolidated_text = consolidate_text(text_detection_dir, detections_store)
+    df = st.session_state.consolidated_text
     
     # Extracted text
     col1, col2 = st.columns(2)
@@ -149,6 +262,13 @@ if selected_image_path:
             st.table(symbol_df)
         else:
             st.write("No symbols detected for the selected image.")
+
+    # Symbol-tag associations from the drawing's overlay layers
+    overlay_path = os.path.join(output_dir, f"overlays_{original_filename}.geojson")
+    if os.path.exists(overlay_path):
+        st.subheader("Symbol Tags")
+        tag_df = get_symbol_tags(original_filename, overlay_path, os.path.getmtime(overlay_path))
+        st.dataframe(tag_df[['symbol_id', 'class_name', 'tag', 'distance']], use_container_width=True)
 else:
     st.warning("No reconstructed images available.")
 
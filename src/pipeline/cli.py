@@ -0,0 +1,205 @@
+# Description: Headless command-line driver for the full pipeline (PDF conversion, slicing, object detection,
+# text detection, OCR and reconstruction) over a source directory. Drawings are sharded across a process pool with
+# one YOLOv5 and EAST model per worker, and progress is recorded in the pipeline manifest so a run can be resumed.
+# Run from the repository root with:
+#   python -m src.pipeline.cli --source-dir Dataset/Demo --workers 8
+# Import necessary libraries
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import pytesseract
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from src.detection.east_text_detector import EASTTextDetector
+from src.detection.ocr_engine import OCREngine
+from src.detection.yolo_object_detection import load_model_from_config, create_object_cache
+from src.pipeline.inference_server import RemoteObjectModel, RemoteTextDetector, open_inference_client
+from src.pipeline.manifest import PipelineManifest, prune_drawings
+from src.pipeline.page_pipeline import process_page, process_pdf, create_worker_pools, record_page, plain_object_boxes
+from src.postprocessing.spatial_index import save_symbol_tags
+from src.postprocessing.text_extraction import consolidate_text
+from src.preprocessing.pdf_to_image_converter import convert_pdf_to_images
+from src.utils.config import PROJECT_ROOT, load_config, get_config_section
+from src.utils.detections_store import open_detections_store
+from src.utils.page_store import open_page_store
+from src.utils.result_cache import open_result_cache
+
+# Models and worker pools of the current worker process, created once by _init_worker
+_worker_state = {}
+
+# Function to find the best.pt weights of the most recent YOLOv5 training run
+def find_latest_weights(runs_dir):
+    run_dirs = sorted(glob.glob(os.path.join(runs_dir, 'exp*')), key=os.path.getmtime, reverse=True)
+    if not run_dirs:
+        raise FileNotFoundError(f"No YOLOv5 training runs found in {runs_dir}. Please train the model first.")
+    return os.path.join(run_dirs[0], 'weights', 'best.pt')
+
+# Function to list the PDFs whose page images are missing or older than the PDF itself
+def find_pdfs_to_convert(pdf_dir, image_dir):
+    pdf_paths = []
+    for pdf_filename in sorted(os.listdir(pdf_dir)):
+        if not pdf_filename.lower().endswith('.pdf'):
+            continue
+        pdf_path = os.path.join(pdf_dir, pdf_filename)
+        first_page = os.path.join(image_dir, f"{Path(pdf_filename).stem}_1.jpg")
+        if not os.path.exists(first_page) or os.path.getmtime(first_page) < os.path.getmtime(pdf_path):
+            pdf_paths.append(pdf_path)
+    return pdf_paths
+
+# Function to load the models once per worker process
+def _init_worker(yolo_weights, east_model, config, threads, tesseract_cmd, detections_dir):
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    # With a resident inference server the workers share its warm models and only run tiling and OCR themselves
+    inference_client = open_inference_client(get_config_section('inference_server', config))
+    model = RemoteObjectModel(inference_client) if inference_client is not None else load_model_from_config(yolo_weights, config)
+    result_cache = open_result_cache(get_config_section('cache', config))
+    _worker_state['model'] = model
+    _worker_state['object_cache'] = create_object_cache(result_cache, model, yolo_weights)
+    if inference_client is not None:
+        _worker_state['text_detector'] = RemoteTextDetector.from_server(
+            inference_client, ocr_engine=OCREngine.from_config(config), result_cache=result_cache
+        )
+    else:
+        _worker_state['text_detector'] = EASTTextDetector.from_config(
+            east_model, config, ocr_engine=OCREngine.from_config(config), result_cache=result_cache
+        )
+    _worker_state['pools'] = create_worker_pools()
+    _worker_state['page_store'] = open_page_store(get_config_section('page_store', config))
+    _worker_state['burn_in'] = get_config_section('overlays', config).get('burn_in', False)
+    _worker_state['detections_store'] = open_detections_store(get_config_section('detections_store', config), detections_dir)
+
+# Function to process one drawing (an image, or every page of a PDF) in a worker process with that worker's models
+def _process_drawing(source_path, text_detection_dir, output_dir, batch_size, min_ink_fraction, ink_threshold, dpi, thread_count):
+    model, text_detector = _worker_state['model'], _worker_state['text_detector']
+    options = dict(pools=_worker_state['pools'], min_ink_fraction=min_ink_fraction, ink_threshold=ink_threshold,
+                   object_cache=_worker_state['object_cache'], page_store=_worker_state['page_store'],
+                   burn_in=_worker_state['burn_in'], detections_store=_worker_state['detections_store'])
+    if source_path.lower().endswith('.pdf'):
+        object_boxes, extracted_texts, output_paths, skipped_tiles = process_pdf(
+            source_path, model, text_detector, text_detection_dir, output_dir, batch_size, dpi=dpi, thread_count=thread_count, **options
+        )
+    else:
+        object_boxes, extracted_texts, output_paths, skipped_tiles = process_page(
+            source_path, model, text_detector, text_detection_dir, output_dir, batch_size, **options
+        )
+    # Plain floats instead of tensors, so the results pickle cheaply back to the parent process
+    return plain_object_boxes(object_boxes), len(extracted_texts), output_paths, skipped_tiles
+
+# Function to parse the command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the P&ID digitisation pipeline over a directory of drawings.")
+    parser.add_argument("--source-dir", default=os.path.join(PROJECT_ROOT, 'Dataset', 'Demo'),
+                        help="Directory holding Images/ and where TextDetection/ and Output/ are written")
+    parser.add_argument("--pdf-dir", default=None, help="Directory of PDFs to convert into Images/ before processing")
+    parser.add_argument("--stream-pdfs", action="store_true",
+                        help="Feed rendered PDF pages straight into the tiler instead of converting them to JPEGs first")
+    parser.add_argument("--yolo-weights", default=None, help="YOLOv5 weights (default: best.pt of the latest training run)")
+    parser.add_argument("--east-model", default=os.path.join(PROJECT_ROOT, 'src', 'detection', 'models', 'frozen_east_text_detection.pb'),
+                        help="Path to frozen_east_text_detection.pb")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: pipeline.workers in the config)")
+    parser.add_argument("--tesseract-cmd", default=None, help="Tesseract executable (default: the Windows install if present, else tesseract on the PATH)")
+    parser.add_argument("--config", default=None, help="Path to an alternative config.yaml")
+    return parser.parse_args(argv)
+
+# Main function to run every stage over the source directory, resuming from the manifest
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config) if args.config else load_config()
+    pipeline_config = get_config_section('pipeline', config)
+    tile_filter_config = get_config_section('tile_filter', config)
+
+    # Split the CPU cores between the worker processes so the model and OCR threads don't oversubscribe them
+    workers = max(1, args.workers or pipeline_config.get('workers', 4))
+    threads = pipeline_config.get('threads_per_worker', 0) or max(1, (os.cpu_count() or 1) // workers)
+    config.setdefault('ocr', {})['workers'] = max(1, min(config['ocr'].get('workers', 4), threads))
+    onnx_config = config.setdefault('onnxruntime', {})
+    onnx_config['intra_op_threads'] = onnx_config.get('intra_op_threads', 0) or threads
+
+    image_dir = os.path.join(args.source_dir, 'Images')
+    text_detection_dir = os.path.join(args.source_dir, 'TextDetection')
+    detections_dir = os.path.join(args.source_dir, 'Detections')
+    output_dir = os.path.join(args.source_dir, 'Output')
+    yolo_weights = args.yolo_weights or find_latest_weights(os.path.join(PROJECT_ROOT, 'yolov5', 'runs', 'train'))
+    # The detector module points at the default Windows install; fall back to tesseract on the PATH elsewhere
+    tesseract_cmd = args.tesseract_cmd or pytesseract.pytesseract.tesseract_cmd
+    if not args.tesseract_cmd and not os.path.exists(tesseract_cmd):
+        tesseract_cmd = 'tesseract'
+    start_time = time.perf_counter()
+
+    pdf_config = get_config_section('pdf_conversion', config)
+    dpi = pdf_config.get('dpi', 200)
+    thread_count = pdf_config.get('thread_count', 2)
+
+    # Stage 1: Convert new or updated PDFs, one PDF per worker, unless pages are streamed straight into the tiler
+    if args.pdf_dir and not args.stream_pdfs:
+        os.makedirs(image_dir, exist_ok=True)
+        pdf_paths = find_pdfs_to_convert(args.pdf_dir, image_dir)
+        print(f"Converting {len(pdf_paths)} PDFs with {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_pdf_to_images, pdf_path, 'jpg', image_dir, dpi, thread_count): pdf_path for pdf_path in pdf_paths}
+            for future in as_completed(futures):
+                print(f"Converted {os.path.basename(futures[future])} ({len(future.result())} pages)")
+
+    # When streaming, each PDF is one drawing in its own manifest; otherwise each page image is
+    if args.pdf_dir and args.stream_pdfs:
+        drawing_dir, extensions, manifest_name = args.pdf_dir, ('.pdf',), 'pipeline_manifest_pdf.json'
+    else:
+        drawing_dir, extensions, manifest_name = image_dir, ('.jpg',), 'pipeline_manifest.json'
+
+    # Work out which drawings still need processing; completed ones from an earlier or interrupted run are kept
+    manifest = PipelineManifest(os.path.join(args.source_dir, manifest_name))
+    plan = manifest.plan(drawing_dir, extensions)
+    prune_drawings(manifest, plan)
+    filenames = plan.new + plan.modified
+    print(f"{len(filenames)} drawings to process, {len(plan.unchanged)} already done, {workers} workers x {threads} threads")
+
+    # Stages 2-5: Slice, detect, OCR and reconstruct each drawing in a worker; the parent is the only manifest writer
+    failed = []
+    skipped_tiles = 0
+    if filenames:
+        initargs = (yolo_weights, args.east_model, config, threads, tesseract_cmd, detections_dir)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = {
+                pool.submit(_process_drawing, os.path.join(drawing_dir, filename), text_detection_dir, output_dir,
+                            get_config_section('object_detection', config).get('batch_size', 32),
+                            tile_filter_config.get('min_ink_fraction', 0.002), tile_filter_config.get('ink_threshold', 160),
+                            dpi, thread_count): filename
+                for filename in filenames
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                filename = futures[future]
+                try:
+                    object_boxes, num_texts, output_paths, page_skipped = future.result()
+                except Exception as e:
+                    # Leave the drawing out of the manifest so the next run retries it
+                    print(f"[{done}/{len(filenames)}] Failed {filename}: {e}")
+                    failed.append(filename)
+                    continue
+                record_page(manifest, os.path.join(drawing_dir, filename), object_boxes, output_paths, page_skipped, text_detection_dir, output_dir)
+                skipped_tiles += page_skipped
+                print(f"[{done}/{len(filenames)}] Done {filename}: {sum(len(b) for b in object_boxes.values())} symbols, {num_texts} text regions")
+
+    # Consolidate the extracted text of every drawing into one CSV
+    detections_store = open_detections_store(get_config_section('detections_store', config), detections_dir)
+    if detections_store is not None or os.path.isdir(text_detection_dir):
+        consolidate_text(text_detection_dir, detections_store)
+
+    # Pair each symbol with its nearest tag across every drawing
+    if detections_store is not None or os.path.isdir(output_dir):
+        save_symbol_tags(output_dir, detections_store, get_config_section('tag_association', config))
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {len(filenames) - len(failed)} drawings in {elapsed:.1f}s, skipped {skipped_tiles} blank tiles, {len(failed)} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+# Description: Resident inference service. One long-lived process holds the YOLOv5 and EAST models in memory and
+# serves tile requests over a Unix socket (localhost TCP where Unix sockets are unavailable). Tiles from concurrent
+# requests are coalesced into micro-batches, closed when full or when the oldest tile has waited max_latency_ms, so
+# several app users or batch jobs share one warm model. The client side plugs into the existing pipeline as a drop-in
+# model and text detector. Run from the repository root with:
+#   python -m src.pipeline.inference_server --yolo-weights yolov5/runs/train/exp/weights/best.pt
+#   python -m src.pipeline.inference_server --metrics
+# Import necessary libraries
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+
+from src.detection.east_text_detector import EASTTextDetector
+from src.detection.ocr_engine import get_default_ocr_engine
+from src.utils.config import PROJECT_ROOT, load_config, get_config_section, resolve_path
+from src.utils.result_cache import StageCache
+
+# Frames are a 4-byte big-endian header length, a JSON header and payload_bytes of raw image data
+FRAME_HEADER = struct.Struct('!I')
+
+# Latencies kept per stage for the percentiles reported by the metrics endpoint
+LATENCY_WINDOW = 2048
+
+# Function to pack a list of uint8 arrays into a request header and payload
+def pack_images(images):
+    arrays = [np.ascontiguousarray(np.asarray(image), dtype=np.uint8) for image in images]
+    return [list(array.shape) for array in arrays], b''.join(array.tobytes() for array in arrays)
+
+# Function to unpack the uint8 arrays of a request payload
+def unpack_images(shapes, payload):
+    images = []
+    offset = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        images.append(np.frombuffer(payload, dtype=np.uint8, count=size, offset=offset).reshape(shape))
+        offset += size
+    return images
+
+# Function to read one frame from an asyncio stream, returning (header, payload)
+async def read_frame(reader):
+    (header_length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(header.get('payload_bytes', 0)) if header.get('payload_bytes') else b''
+    return header, payload
+
+# Function to write one frame to an asyncio stream
+async def write_frame(writer, header, payload=b''):
+    encoded = json.dumps(dict(header, payload_bytes=len(payload))).encode('utf-8')
+    writer.write(FRAME_HEADER.pack(len(encoded)) + encoded + payload)
+    await writer.drain()
+
+# Throughput, batching and queue metrics of one micro-batcher
+class BatchMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.items = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # Metrics as a JSON-serialisable dict; queue_depth comes from the batcher
+    def snapshot(self, queue_depth):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'requests': self.requests,
+            'items': self.items,
+            'batches': self.batches,
+            'errors': self.errors,
+            'queue_depth': queue_depth,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'items_per_second': self.items / elapsed,
+            'model_utilisation': self.busy_seconds / elapsed,
+            'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'latency_p95_ms': float(np.percentile(latencies, 95) * 1000),
+        }
+
+# Coalesces single-tile work items from concurrent requests into batches for one model, which runs in its own thread
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=32, max_latency_ms=10):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max_latency_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.metrics = BatchMetrics()
+        # Models are not safe to call from several threads at once, so each batcher has one model thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+
+    # Queue the items of one request and wait for their results, in order
+    async def submit(self, items):
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        enqueued = time.perf_counter()
+        self.metrics.requests += 1
+        for item, future in zip(items, futures):
+            self.queue.put_nowait((item, future, enqueued))
+        return await asyncio.gather(*futures)
+
+    # Collect one batch: wait for a first item, then take more until the batch is full or the latency window closes
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = batch[0][2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    # Serve batches until cancelled
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _, _ in batch])
+            except Exception as e:
+                self.metrics.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            self.metrics.busy_seconds += finished - start
+            self.metrics.batches += 1
+            self.metrics.items += len(batch)
+            for (_, future, enqueued), result in zip(batch, results):
+                self.metrics.latencies.append(finished - enqueued)
+                if not future.done():
+                    future.set_result(result)
+
+# Inference server holding one YOLOv5 model and one EAST network, with a micro-batcher per model and input layout
+class InferenceServer:
+    def __init__(self, model, text_detector, max_batch_size=32, max_latency_ms=10, info=None):
+        self.model = model
+        self.text_detector = text_detector
+        self.info = dict(info or {}, names=getattr(model, 'names', {}), conf=getattr(model, 'conf', None), iou=getattr(model, 'iou', None))
+        self.batchers = {
+            'yolo': MicroBatcher(self._run_yolo, max_batch_size, max_latency_ms),
+            'east_rgb': MicroBatcher(lambda images: text_detector._locate_uncached(images, True), max_batch_size, max_latency_ms),
+            'east_bgr': MicroBatcher(lambda images: text_detector._locate_uncached(images, False), max_batch_size, max_latency_ms),
+        }
+        self.connections = 0
+
+    # Run YOLOv5 over a batch of tiles, returning each tile's detections as [x0, y0, x1, y1, confidence, class] rows
+    def _run_yolo(self, images):
+        results = self.model(list(images))
+        # The PyTorch model returns tensors, the ONNX Runtime model numpy arrays
+        return [np.asarray(detections.cpu().numpy() if hasattr(detections, 'cpu') else detections).tolist()
+                for detections in results.xyxy]
+
+    # Current metrics of every batcher
+    def metrics(self):
+        return {'connections': self.connections,
+                'stages': {name: batcher.metrics.snapshot(batcher.queue.qsize()) for name, batcher in self.batchers.items()}}
+
+    # Answer one request frame
+    async def _handle_request(self, header, payload):
+        op = header.get('op')
+        if op == 'info':
+            return self.info
+        if op == 'metrics':
+            return self.metrics()
+        if op == 'yolo':
+            return {'detections': await self.batchers['yolo'].submit(unpack_images(header['shapes'], payload))}
+        if op == 'east':
+            batcher = self.batchers['east_rgb' if header.get('rgb', True) else 'east_bgr']
+            return {'boxes': await batcher.submit(unpack_images(header['shapes'], payload))}
+        raise ValueError(f"Unknown operation: {op}")
+
+    # Serve the requests of one client connection until it closes
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    header, payload = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    response = await self._handle_request(header, payload)
+                except Exception as e:
+                    response = {'error': f"{type(e).__name__}: {e}"}
+                await write_frame(writer, response)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    # Listen on a Unix socket (or localhost TCP port when Unix sockets are unavailable) until cancelled
+    async def serve(self, socket_path, port=8765):
+        tasks = [asyncio.create_task(batcher.run()) for batcher in self.batchers.values()]
+        if hasattr(socket, 'AF_UNIX'):
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+            server = await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+            print(f"Inference server listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(self._handle_connection, host='127.0.0.1', port=port)
+            print(f"Inference server listening on 127.0.0.1:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if hasattr(socket, 'AF_UNIX') and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+# Synchronous client of the inference server; each thread gets its own connection so pipeline threads can share it
+class InferenceClient:
+    def __init__(self, socket_path, port=8765, timeout=300):
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # Connection of the calling thread, opened on first use
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if hasattr(socket, 'AF_UNIX'):
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.settimeout(self.timeout)
+                connection.connect(self.socket_path)
+            else:
+                connection = socket.create_connection(('127.0.0.1', self.port), timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    # Read exactly size bytes from a connection
+    @staticmethod
+    def _receive(connection, size):
+        chunks = []
+        while size > 0:
+            chunk = connection.recv(min(size, 1 << 20))
+            if not chunk:
+                raise ConnectionError("Inference server closed the connection.")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    # Send one request and return the decoded response, raising RuntimeError on a server-side error
+    def request(self, header, payload=b''):
+        connection = self._connection()
+        try:
+            encoded = json.dumps(dict(header, payload_bytes=len(payload))).encode('utf-8')
+            connection.sendall(FRAME_HEADER.pack(len(encoded)) + encoded + payload)
+            (header_length,) = FRAME_HEADER.unpack(self._receive(connection, FRAME_HEADER.size))
+            response = json.loads(self._receive(connection, header_length))
+        except (OSError, ValueError):
+            # Drop the connection so the next request reconnects
+            self._local.connection = None
+            connection.close()
+            raise
+        if 'error' in response:
+            raise RuntimeError(f"Inference server error: {response['error']}")
+        return response
+
+    # Model information: class names, thresholds and the weights the server was started with
+    def info(self):
+        return self.request({'op': 'info'})
+
+    # Throughput, batching and queue metrics of the server
+    def metrics(self):
+        return self.request({'op': 'metrics'})
+
+    # YOLOv5 detections of a list of tiles, as one (N, 6) [x0, y0, x1, y1, confidence, class] array per tile
+    def detect(self, images):
+        shapes, payload = pack_images(images)
+        detections = self.request({'op': 'yolo', 'shapes': shapes}, payload)['detections']
+        return [np.array(rows, dtype=np.float32).reshape(-1, 6) for rows in detections]
+
+    # EAST text boxes of a list of tiles (RGB unless rgb=False), in tile coordinates
+    def locate_text(self, images, rgb=True):
+        shapes, payload = pack_images(images)
+        boxes = self.request({'op': 'east', 'shapes': shapes, 'rgb': rgb}, payload)['boxes']
+        return [[tuple(box) for box in image_boxes] for image_boxes in boxes]
+
+# Stand-in for the YOLOv5 hub model that forwards batches to the inference server; called with a list of images it
+# returns an object with one xyxy detections array per image, like the hub model's results
+class RemoteObjectModel:
+    def __init__(self, client):
+        self.client = client
+        info = client.info()
+        # JSON turns the integer class ids of model.names into strings
+        self.names = {int(label): name for label, name in info['names'].items()} if isinstance(info['names'], dict) else list(info['names'])
+        self.conf = info.get('conf')
+        self.iou = info.get('iou')
+        self.weights_hash = info.get('weights_hash')
+
+    def __call__(self, images):
+        return SimpleNamespace(xyxy=self.client.detect(images if isinstance(images, list) else [images]))
+
+# Text detector that locates text through the inference server and runs Tesseract OCR locally
+class RemoteTextDetector(EASTTextDetector):
+    def __init__(self, client, ocr_engine=None, result_cache=None, model_hash=None, params=None, batch_size=32):
+        self.client = client
+        # Patches sent per request; the server batches them again across callers
+        self.batch_size = max(1, int(batch_size))
+        self.ocr_engine = ocr_engine if ocr_engine is not None else get_default_ocr_engine()
+        self.text_cache = None
+        self.ocr_cache = None
+        if result_cache is not None:
+            if model_hash is not None:
+                self.text_cache = StageCache(result_cache, 'east', model_hash, params)
+            self.ocr_cache = StageCache(result_cache, 'ocr', 'tesseract', self.ocr_engine.cache_params())
+
+    # Create a remote detector for the EAST network the server was started with
+    @classmethod
+    def from_server(cls, client, ocr_engine=None, result_cache=None):
+        info = client.info()
+        return cls(client, ocr_engine, result_cache, info.get('east_hash'), info.get('east_params'), info.get('max_batch_size', 32))
+
+    # Locate text through the server; batching across callers happens there
+    def _locate_uncached(self, images, rgb):
+        return self.client.locate_text(images, rgb)
+
+# Function to open a client of the inference server described by the inference_server section of the config, or None
+def open_inference_client(server_config):
+    if not server_config or not server_config.get('enabled', False):
+        return None
+    return InferenceClient(resolve_path(server_config.get('socket_path', './outputs/inference.sock')), server_config.get('port', 8765))
+
+# Function to parse the command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve YOLOv5 and EAST inference to the app and batch jobs over a local socket.")
+    parser.add_argument("--yolo-weights", default=None, help="YOLOv5 weights (default: best.pt of the latest training run)")
+    parser.add_argument("--east-model", default=os.path.join(PROJECT_ROOT, 'src', 'detection', 'models', 'frozen_east_text_detection.pb'),
+                        help="Path to frozen_east_text_detection.pb")
+    parser.add_argument("--socket", default=None, help="Unix socket path (default: inference_server.socket_path in the config)")
+    parser.add_argument("--metrics", action="store_true", help="Print the metrics of a running server and exit")
+    parser.add_argument("--config", default=None, help="Path to an alternative config.yaml")
+    return parser.parse_args(argv)
+
+# Main function to start the server, or query a running one for its metrics
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config) if args.config else load_config()
+    server_config = get_config_section('inference_server', config)
+    socket_path = args.socket or resolve_path(server_config.get('socket_path', './outputs/inference.sock'))
+    port = server_config.get('port', 8765)
+
+    if args.metrics:
+        print(json.dumps(InferenceClient(socket_path, port).metrics(), indent=2))
+        return 0
+
+    # Imported here so querying metrics doesn't need torch
+    from src.detection.yolo_object_detection import load_model_from_config
+    from src.pipeline.cli import find_latest_weights
+    from src.utils.result_cache import hash_file
+
+    yolo_weights = args.yolo_weights or find_latest_weights(os.path.join(PROJECT_ROOT, 'yolov5', 'runs', 'train'))
+    model = load_model_from_config(yolo_weights, config)
+    text_detector = EASTTextDetector.from_config(args.east_model, config)
+    info = {
+        'yolo_weights': os.path.abspath(yolo_weights),
+        'weights_hash': model.weights_hash,
+        # Hash the graph the detector actually loaded (the ONNX export under onnxruntime), as its local text cache does
+        'east_hash': hash_file(getattr(text_detector.net, 'model_path', args.east_model)),
+        'east_params': {'size': (text_detector.newW, text_detector.newH), 'min_confidence': text_detector.min_confidence,
+                        'nms_threshold': text_detector.nms_threshold},
+        'max_batch_size': server_config.get('max_batch_size', 32),
+    }
+    server = InferenceServer(model, text_detector, server_config.get('max_batch_size', 32), server_config.get('max_latency_ms', 10), info)
+    try:
+        asyncio.run(server.serve(socket_path, port))
+    except KeyboardInterrupt:
+        print("Inference server stopped.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# Description: Manifest of processed drawings. Records each source image's hash, its patches and the outputs of each
+# pipeline stage, so a run only processes new or modified drawings and prunes the outputs of removed ones.
+# Import necessary libraries
+import json
+import os
+import time
+from collections import namedtuple
+
+from src.utils.result_cache import hash_file
+
+# Pipeline stages tracked per drawing, in the order they run
+STAGES = ['slicing', 'yolo', 'east', 'ocr', 'reconstruction']
+
+# Drawings to (re)process, left as they are, and removed from the source directory
+RunPlan = namedtuple('RunPlan', ['new', 'modified', 'unchanged', 'removed'])
+
+# JSON-backed state store for the drawings of one source directory
+class PipelineManifest:
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.drawings = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+                self.drawings = json.load(manifest_file).get('drawings', {})
+
+    # Compare the source images in image_dir with the manifest and work out what needs doing
+    def plan(self, image_dir, extensions=('.jpg',)):
+        current = {f: os.path.join(image_dir, f) for f in os.listdir(image_dir) if f.lower().endswith(extensions)}
+        new, modified, unchanged = [], [], []
+        for filename in sorted(current):
+            entry = self.drawings.get(filename)
+            if entry is None:
+                new.append(filename)
+            elif entry['hash'] != hash_file(current[filename]) or not self.is_complete(filename):
+                modified.append(filename)
+            else:
+                unchanged.append(filename)
+        removed = sorted(set(self.drawings) - set(current))
+        return RunPlan(new, modified, unchanged, removed)
+
+    # Check whether every stage has been recorded for a drawing
+    def is_complete(self, filename, stages=STAGES):
+        recorded = self.drawings.get(filename, {}).get('stages', {})
+        return all(stage in recorded for stage in stages)
+
+    # Check whether a single stage still needs to run for a drawing
+    def needs_stage(self, filename, stage):
+        return stage not in self.drawings.get(filename, {}).get('stages', {})
+
+    # Record a (re)processed source image, clearing any stage outputs from a previous version
+    def record_source(self, filename, image_path, patches=None):
+        self.drawings[filename] = {'hash': hash_file(image_path), 'patches': list(patches or []), 'stages': {}}
+
+    # Record a completed stage and the files it produced
+    def record_stage(self, filename, stage, outputs=None, **details):
+        entry = self.drawings[filename]
+        entry['stages'][stage] = {'completed_at': time.time(), 'outputs': list(outputs or []), **details}
+
+    # Files recorded for a drawing, optionally only for one stage
+    def outputs(self, filename, stage=None):
+        stages = self.drawings.get(filename, {}).get('stages', {})
+        if stage is not None:
+            return list(stages.get(stage, {}).get('outputs', []))
+        return [path for stage_info in stages.values() for path in stage_info.get('outputs', [])]
+
+    # Forget a drawing and return the files recorded for it so they can be pruned
+    def remove(self, filename):
+        outputs = self.outputs(filename)
+        self.drawings.pop(filename, None)
+        return outputs
+
+    # Write the manifest atomically so an interrupted run never leaves a half-written file
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump({'drawings': self.drawings}, manifest_file, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+# Function to delete output files of removed or modified drawings
+def prune_outputs(paths):
+    pruned = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            pruned += 1
+    return pruned
+
+# Function to drop removed and modified drawings from the manifest and delete their old outputs
+def prune_drawings(manifest, plan):
+    stale_outputs = []
+    for filename in plan.removed + plan.modified:
+        stale_outputs.extend(manifest.remove(filename))
+    pruned = prune_outputs(stale_outputs)
+    if plan.removed or plan.modified:
+        print(f"Pruned {pruned} output files of {len(plan.removed)} removed and {len(plan.modified)} modified drawings")
+        manifest.save()
+    return pruned
@@ -0,0 +1,366 @@
+# Description: Streaming pipeline that tiles each page in memory, runs object and text detection on the patch views
+# and writes only the final artifacts (annotated page, extracted text and text box CSVs) to disk.
+# Object and text detection both read the original patches and run concurrently in their own worker pools;
+# box overlays are composited once at the end.
+# Import necessary libraries
+import json
+import os
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from src.detection.east_text_detector import save_text_results
+from src.detection.yolo_object_detection import detect_objects_in_images, detect_objects_batch
+from src.postprocessing.image_deconstruction import tile_image, find_content_tiles, patch_filename_for, patch_size, step_size
+from src.pipeline.manifest import prune_drawings
+from src.postprocessing.page_aggregation import aggregate_object_boxes, deduplicate_text_boxes, parse_patch_filename
+from src.preprocessing.pdf_to_image_converter import iter_pdf_pages, page_filename_for
+from src.postprocessing.overlays import build_layers, export_overlays
+from src.utils.detections_store import rows_from_layers, read_part_texts
+from src.utils.page_store import save_page
+
+# Function to load a page as an RGB array
+def load_page(image_path):
+    return np.array(Image.open(image_path).convert('RGB'))
+
+# Function to load a page (path or PIL image) into RAM, or map it through the page store when it is large enough
+def open_page(image, name, page_store=None):
+    if page_store is not None and page_store.should_store(image):
+        return page_store.import_image(name, image)
+    if isinstance(image, Image.Image):
+        return np.array(image.convert('RGB'))
+    return load_page(image)
+
+# Function to translate a patch-local box into page coordinates
+def to_page_box(box, i, j):
+    (startX, startY, endX, endY) = box
+    return (startX + j * step_size, startY + i * step_size, endX + j * step_size, endY + i * step_size)
+
+# Function to create the two worker pools; each holds one model so no network is shared between threads
+def create_worker_pools():
+    object_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='object-detection')
+    text_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='text-detection')
+    return object_pool, text_pool
+
+# Function to OCR the given text boxes of each patch and save the per-patch text/CSV outputs (unless text_detection_dir
+# is None, when the results go to the detections store instead), returning patch filename -> list of (box, text)
+def _extract_and_save_text(text_detector, patches, patch_filenames, boxes_per_patch, text_detection_dir):
+    if text_detection_dir is not None:
+        os.makedirs(text_detection_dir, exist_ok=True)
+    text_results = {}
+    extracted = text_detector.extract_text_batch(patches, boxes_per_patch)
+    for patch_filename, (texts, bounding_boxes) in zip(patch_filenames, extracted):
+        if text_detection_dir is not None:
+            save_text_results(patch_filename, texts, bounding_boxes, text_detection_dir)
+        text_results[patch_filename] = list(zip(bounding_boxes, texts))
+    return text_results
+
+# Function to flatten per-patch (box, text) OCR results into the extracted texts, in patch order
+def texts_from_results(text_results):
+    return [text for results in text_results.values() for _, text in results]
+
+# Function to run text detection and OCR over patch arrays, saving the per-patch text/CSV outputs
+def detect_text_in_patches(text_detector, patches, patch_filenames, text_detection_dir, rgb=True):
+    located = text_detector.locate_text_batch(patches, rgb=rgb)
+
+    # Drop duplicate boxes on patch seams so each piece of text is only OCR'd once
+    text_boxes = deduplicate_text_boxes(dict(zip(patch_filenames, located)))
+    boxes_per_patch = [text_boxes[patch_filename] for patch_filename in patch_filenames]
+
+    text_results = _extract_and_save_text(text_detector, patches, patch_filenames, boxes_per_patch, text_detection_dir)
+    return text_boxes, text_results
+
+# Function to draw object (red) and text (green) boxes onto an image in a single pass
+def draw_overlays(image, object_boxes, text_boxes, offset=(0, 0), rgb=True):
+    (i, j) = offset
+    red = (255, 0, 0) if rgb else (0, 0, 255)
+    for box in object_boxes:
+        xyxy = tuple(int(float(c)) for c in box['bbox_coordinates'])
+        (startX, startY, endX, endY) = to_page_box(xyxy, i, j)
+        cv2.rectangle(image, (startX, startY), (endX, endY), red, 4)
+    for box in text_boxes:
+        (startX, startY, endX, endY) = to_page_box(box, i, j)
+        cv2.rectangle(image, (startX, startY), (endX, endY), (0, 255, 0), 2)
+    return image
+
+# Function to process a single page entirely in memory, or through memory-mapped windows for pages in the page store
+# (image_path only names the outputs when an already rendered page, as an array or PIL image, is passed in)
+# Detections are exported as GeoJSON/SVG overlay layers; burn_in also renders them into an annotated JPEG.
+# With a detections store, the page's detections are written there instead of per-patch CSV and TXT files
+def process_page(image_path, model, text_detector, text_detection_dir, output_dir, batch_size=32, pools=None,
+                 min_ink_fraction=0.002, ink_threshold=160, object_cache=None, page=None, page_store=None, burn_in=False,
+                 detections_store=None):
+    filename = os.path.basename(image_path)
+    base_name = filename.split('.')[0]
+    print(f"Processing page: {filename}")
+    start_time = time.perf_counter()
+    if not isinstance(page, np.ndarray):
+        page = open_page(page if page is not None else image_path, f"page_{base_name}", page_store)
+
+    # Tile the page into zero-copy patch views, in the same row-major order as slice_images
+    patches = tile_image(page)
+
+    # Drop near-empty tiles (blank paper) before any model runs
+    content_tiles = find_content_tiles(page, min_ink_fraction, ink_threshold)
+    grid = [(i, j) for i in range(patches.shape[0]) for j in range(patches.shape[1]) if content_tiles[i, j]]
+    skipped_tiles = content_tiles.size - len(grid)
+    patch_views = [patches[i, j] for i, j in grid]
+    patch_filenames = [patch_filename_for(filename, i, j) for i, j in grid]
+
+    # Object and text detection both read the same original views and run concurrently
+    object_pool, text_pool = pools if pools is not None else create_worker_pools()
+    try:
+        object_future = object_pool.submit(detect_objects_in_images, patch_views, patch_filenames, model, batch_size, object_cache)
+        text_future = text_pool.submit(detect_text_in_patches, text_detector, patch_views, patch_filenames,
+                                       text_detection_dir if detections_store is None else None)
+        object_boxes = object_future.result()
+        text_boxes, text_results = text_future.result()
+    finally:
+        if pools is None:
+            object_pool.shutdown()
+            text_pool.shutdown()
+    extracted_texts = texts_from_results(text_results)
+
+    # Keep the page-level detections as vector layers, with each seam duplicate only once
+    page_objects = aggregate_object_boxes(object_boxes).get(base_name, [])
+    layers = build_layers(page_objects, text_results)
+    output_paths = export_overlays(output_dir, base_name, layers, page.shape[1], page.shape[0])
+    if detections_store is not None:
+        output_paths.append(detections_store.write_drawing(base_name, rows_from_layers(layers)))
+
+    # Optionally composite all overlays onto one copy of the page and encode it once;
+    # a mapped page gets a mapped copy so the overlays are drawn window by window
+    mapped = isinstance(page, np.memmap)
+    if burn_in:
+        annotated = page_store.copy_page(f"annotated_{base_name}", page) if mapped else page.copy()
+        draw_overlays(annotated, page_objects, [])
+        for (i, j), patch_filename in zip(grid, patch_filenames):
+            draw_overlays(annotated, [], text_boxes[patch_filename], offset=(i, j))
+        output_path = os.path.join(output_dir, f"reconstructed_{base_name}.jpg")
+        save_page(annotated, output_path)
+        output_paths.append(output_path)
+        annotated = None
+    if mapped:
+        # Drop every view of the mapped pages before deleting their backing files
+        del patches, patch_views, page
+        page_store.remove(f"page_{base_name}")
+        page_store.remove(f"annotated_{base_name}")
+    print(f"Processed {filename} ({len(grid)} patches, {skipped_tiles} blank tiles skipped) in {time.perf_counter() - start_time:.1f}s")
+
+    return object_boxes, extracted_texts, output_paths, skipped_tiles
+
+# Function to convert YOLOv5 box coordinates from tensors to plain floats so the boxes can be saved or pickled
+def plain_object_boxes(object_boxes):
+    return {
+        patch_filename: [dict(box, bbox_coordinates=[float(c) for c in box['bbox_coordinates']]) for box in boxes]
+        for patch_filename, boxes in object_boxes.items()
+    }
+
+# Function to save a page's YOLOv5 boxes as JSON so unchanged drawings can be reloaded without inference
+def save_object_boxes(json_path, object_boxes):
+    with open(json_path, 'w', encoding='utf-8') as json_file:
+        json.dump(plain_object_boxes(object_boxes), json_file)
+
+# Function to load a page's YOLOv5 boxes saved by save_object_boxes
+def load_object_boxes(json_path):
+    with open(json_path, 'r', encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+# Function to record every stage output of a processed page (or of every page of a PDF) in the manifest
+def record_page(manifest, image_path, object_boxes, output_paths, skipped_tiles, text_detection_dir, output_dir):
+    filename = os.path.basename(image_path)
+    base_name = filename.split('.')[0]
+    patch_filenames = sorted(object_boxes)
+
+    boxes_path = os.path.join(output_dir, f"object_boxes_{base_name}.json")
+    save_object_boxes(boxes_path, object_boxes)
+
+    manifest.record_source(filename, image_path, patch_filenames)
+    manifest.record_stage(filename, 'slicing', skipped_tiles=skipped_tiles)
+    manifest.record_stage(filename, 'yolo', [boxes_path])
+    # With a detections store the text boxes and OCR text live in the drawing's Parquet part, not per-patch files
+    part_paths = [path for path in output_paths if path.endswith('.parquet')]
+    if part_paths:
+        manifest.record_stage(filename, 'east', part_paths)
+        manifest.record_stage(filename, 'ocr', part_paths)
+    else:
+        manifest.record_stage(filename, 'east', [os.path.join(text_detection_dir, f"bounding_boxes_{f}.csv") for f in patch_filenames])
+        manifest.record_stage(filename, 'ocr', [os.path.join(text_detection_dir, f"text_extraction_{f}.txt") for f in patch_filenames])
+    manifest.record_stage(filename, 'reconstruction', output_paths)
+    manifest.save()
+
+# Function to reload the results of a drawing that the manifest shows as unchanged
+def load_recorded_page(manifest, filename):
+    object_boxes = {}
+    for boxes_path in manifest.outputs(filename, 'yolo'):
+        object_boxes.update(load_object_boxes(boxes_path))
+    extracted_texts = []
+    for text_path in manifest.outputs(filename, 'ocr'):
+        if text_path.endswith('.parquet'):
+            extracted_texts.extend(read_part_texts(text_path))
+            continue
+        with open(text_path, 'r', encoding='utf-8') as text_file:
+            extracted_texts.extend(line.rstrip('\n') for line in text_file)
+    return object_boxes, extracted_texts, manifest.outputs(filename, 'reconstruction')
+
+# Function to process every page of a PDF as it is rendered, feeding each page straight into the tiler without
+# writing an intermediate JPEG; only thread_count pages are rendered at a time
+def process_pdf(pdf_path, model, text_detector, text_detection_dir, output_dir, batch_size=32, pools=None,
+                min_ink_fraction=0.002, ink_threshold=160, object_cache=None, dpi=200, thread_count=1, page_store=None,
+                burn_in=False, detections_store=None):
+    object_boxes = {}
+    extracted_texts = []
+    output_paths = []
+    skipped_tiles = 0
+    for page_number, image in iter_pdf_pages(pdf_path, dpi, thread_count):
+        # Same greyscale-as-RGB page (and patch names) as converting to JPEG and loading it with load_page
+        page_path = os.path.join(os.path.dirname(pdf_path), page_filename_for(pdf_path, page_number))
+        page_boxes, page_texts, page_outputs, page_skipped = process_page(
+            page_path, model, text_detector, text_detection_dir, output_dir, batch_size, pools=pools,
+            min_ink_fraction=min_ink_fraction, ink_threshold=ink_threshold, object_cache=object_cache, page=image,
+            page_store=page_store, burn_in=burn_in, detections_store=detections_store
+        )
+        object_boxes.update(page_boxes)
+        extracted_texts.extend(page_texts)
+        output_paths.extend(page_outputs)
+        skipped_tiles += page_skipped
+    return object_boxes, extracted_texts, output_paths, skipped_tiles
+
+# Function to run the streaming pipeline over every page in a directory; with a manifest, only new or modified
+# drawings are processed, unchanged ones are reloaded from their recorded outputs and removed ones are pruned
+def process_pages(image_dir, model, text_detector, text_detection_dir, output_dir, batch_size=32,
+                  min_ink_fraction=0.002, ink_threshold=160, object_cache=None, manifest=None, page_store=None, burn_in=False,
+                  detections_store=None):
+    object_boxes = {}
+    extracted_texts = []
+    output_paths = []
+    skipped_tiles = 0
+
+    filenames = sorted(f for f in os.listdir(image_dir) if f.endswith(".jpg"))
+    if manifest is not None:
+        plan = manifest.plan(image_dir)
+        prune_drawings(manifest, plan)
+        filenames = plan.new + plan.modified
+        print(f"{len(filenames)} new or modified drawings to process, {len(plan.unchanged)} unchanged")
+        for filename in plan.unchanged:
+            page_boxes, page_texts, page_outputs = load_recorded_page(manifest, filename)
+            object_boxes.update(page_boxes)
+            extracted_texts.extend(page_texts)
+            output_paths.extend(page_outputs)
+
+    object_pool, text_pool = create_worker_pools()
+    with object_pool, text_pool:
+        for filename in filenames:
+            image_path = os.path.join(image_dir, filename)
+            page_boxes, page_texts, page_outputs, page_skipped = process_page(
+                image_path, model, text_detector, text_detection_dir, output_dir,
+                batch_size, pools=(object_pool, text_pool),
+                min_ink_fraction=min_ink_fraction, ink_threshold=ink_threshold, object_cache=object_cache,
+                page_store=page_store, burn_in=burn_in, detections_store=detections_store
+            )
+            if manifest is not None:
+                record_page(manifest, image_path, page_boxes, page_outputs, page_skipped, text_detection_dir, output_dir)
+            object_boxes.update(page_boxes)
+            extracted_texts.extend(page_texts)
+            output_paths.extend(page_outputs)
+            skipped_tiles += page_skipped
+    print(f"Skipped {skipped_tiles} blank tiles across {len(filenames)} processed pages")
+    return object_boxes, extracted_texts, output_paths, skipped_tiles
+
+# Function to read a chunk of patch files, skipping any that fail to load
+def _read_patches(patch_paths):
+    loaded = [(os.path.basename(p), cv2.imread(p)) for p in patch_paths]
+    return [(name, patch) for name, patch in loaded if patch is not None]
+
+# Function to run text detection over patch files in chunks so only batch_size patches are held in memory
+def _detect_text_in_patch_files(text_detector, patch_paths, text_detection_dir):
+    chunks = [patch_paths[start:start + text_detector.batch_size] for start in range(0, len(patch_paths), text_detector.batch_size)]
+
+    # First pass: locate text in every patch
+    located = {}
+    for chunk in chunks:
+        loaded = _read_patches(chunk)
+        located.update(zip([name for name, _ in loaded], text_detector.locate_text_batch([patch for _, patch in loaded])))
+
+    # Drop duplicate boxes on patch seams across each drawing before any OCR work is done
+    text_boxes = deduplicate_text_boxes(located)
+
+    # Second pass: OCR only the kept boxes
+    text_results = {}
+    for chunk in chunks:
+        loaded = _read_patches(chunk)
+        text_results.update(_extract_and_save_text(
+            text_detector, [patch for _, patch in loaded], [name for name, _ in loaded],
+            [text_boxes[name] for name, _ in loaded], text_detection_dir
+        ))
+    return text_boxes, text_results
+
+# Function to export the overlay layers (and detections store rows) of every drawing found in a set of patch
+# detections, returning their paths; the page size is taken from the patch grid
+def export_patch_overlays(object_boxes, text_results, output_dir, detections_store=None):
+    text_results_by_page = {}
+    grid_by_page = {}
+    for patch_filename in set(object_boxes) | set(text_results):
+        base_name, i, j = parse_patch_filename(patch_filename)
+        if base_name is None:
+            continue
+        text_results_by_page.setdefault(base_name, {})[patch_filename] = text_results.get(patch_filename, [])
+        (max_i, max_j) = grid_by_page.get(base_name, (0, 0))
+        grid_by_page[base_name] = (max(max_i, i), max(max_j, j))
+
+    page_detections = aggregate_object_boxes(object_boxes)
+    output_paths = []
+    for base_name, (max_i, max_j) in sorted(grid_by_page.items()):
+        layers = build_layers(page_detections.get(base_name, []), text_results_by_page[base_name])
+        width, height = max_j * step_size + patch_size[1], max_i * step_size + patch_size[0]
+        output_paths.extend(export_overlays(output_dir, base_name, layers, width, height))
+        if detections_store is not None:
+            output_paths.append(detections_store.write_drawing(base_name, rows_from_layers(layers)))
+    return output_paths
+
+# Function to run object and text detection concurrently on the original patch files and export the overlay layers
+# of each drawing to output_dir; burn_in also writes one annotated copy of each patch (for reconstruct_images)
+# with both overlays composited at once
+def detect_patches_concurrently(patches_dir, model, text_detector, text_detection_dir, batch_size=32, object_cache=None,
+                                output_dir=None, burn_in=False, detections_store=None):
+    patch_files = sorted(f for f in os.listdir(patches_dir) if f.endswith(".jpg"))
+    patch_paths = [os.path.join(patches_dir, f) for f in patch_files]
+
+    object_pool, text_pool = create_worker_pools()
+    with object_pool, text_pool:
+        object_future = object_pool.submit(detect_objects_batch, patch_paths, model, batch_size, object_cache)
+        text_future = text_pool.submit(_detect_text_in_patch_files, text_detector, patch_paths,
+                                       text_detection_dir if detections_store is None else None)
+        object_boxes = object_future.result()
+        text_boxes, text_results = text_future.result()
+
+    if output_dir is not None:
+        export_patch_overlays(object_boxes, text_results, output_dir, detections_store)
+
+    # Composite overlays onto each original patch once
+    if burn_in:
+        for patch_file, patch_path in zip(patch_files, patch_paths):
+            patch = cv2.imread(patch_path)
+            if patch is None:
+                continue
+            draw_overlays(patch, object_boxes.get(patch_file, []), text_boxes.get(patch_file, []), rgb=False)
+            cv2.imwrite(os.path.join(text_detection_dir, patch_file), patch)
+
+    return object_boxes, texts_from_results(text_results)
+
+# Function to record the outputs of the disk-based detection and reconstruction steps for every sliced drawing
+def record_disk_outputs(manifest, text_detection_dir, output_dir, detections_store=None):
+    for filename, entry in manifest.drawings.items():
+        patch_filenames = entry['patches']
+        manifest.record_stage(filename, 'yolo')
+        manifest.record_stage(filename, 'east', [os.path.join(text_detection_dir, f"bounding_boxes_{f}.csv") for f in patch_filenames]
+                              + [os.path.join(text_detection_dir, f) for f in patch_filenames])
+        manifest.record_stage(filename, 'ocr', [os.path.join(text_detection_dir, f"text_extraction_{f}.txt") for f in patch_filenames])
+        base_name = filename.split('.')[0]
+        manifest.record_stage(filename, 'reconstruction', [os.path.join(output_dir, f"reconstructed_{base_name}.jpg"),
+                                                           os.path.join(output_dir, f"overlays_{base_name}.geojson"),
+                                                           os.path.join(output_dir, f"overlays_{base_name}.svg")]
+                              + ([detections_store.drawing_path(base_name)] if detections_store is not None else []))
+    manifest.save()
@@ -9,27 +9,93 @@ from patchify import patchify
 patch_size = (448, 448, 3)
 step_size = 416  # Step size for patchifying
 
-# Function to slice images in a directory
-def slice_images(image_dir, patches_dir):
+# Function to tile a page array into a (rows, cols, 448, 448, 3) grid of patches
+def tile_image(img):
+    # patchify builds strided views into img, so no pixel data is copied here
+    patches = patchify(img, patch_size, step=step_size)
+    return patches[:, :, 0]
+
+# Function to find which tiles of a page contain ink, returning a (rows, cols) boolean mask matching tile_image
+def find_content_tiles(img, min_ink_fraction=0.002, ink_threshold=160, downsample=4):
+    rows = (img.shape[0] - patch_size[0]) // step_size + 1
+    cols = (img.shape[1] - patch_size[1]) // step_size + 1
+    if min_ink_fraction <= 0:
+        return np.ones((max(rows, 0), max(cols, 0)), dtype=bool)
+
+    # Ink mask on a strided (downsampled) view of the page; dark pixels on white paper count as ink
+    small = img[::downsample, ::downsample]
+    if small.ndim == 3:
+        small = small.min(axis=2)
+    ink = (small < ink_threshold).astype(np.int32)
+
+    # Integral image so every tile's ink count is four lookups
+    integral = np.zeros((ink.shape[0] + 1, ink.shape[1] + 1), dtype=np.int64)
+    integral[1:, 1:] = ink.cumsum(axis=0).cumsum(axis=1)
+
+    y0 = (np.arange(rows) * step_size) // downsample
+    x0 = (np.arange(cols) * step_size) // downsample
+    y1 = np.minimum(y0 + patch_size[0] // downsample, ink.shape[0])
+    x1 = np.minimum(x0 + patch_size[1] // downsample, ink.shape[1])
+    ink_counts = integral[y1][:, x1] - integral[y0][:, x1] - integral[y1][:, x0] + integral[y0][:, x0]
+    tile_areas = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+
+    return ink_counts >= min_ink_fraction * tile_areas
+
+# Function to build the patch filename used for patch (i, j) of an image
+def patch_filename_for(filename, i, j):
+    return f"{filename.split('.')[0]}_patch_{i}_{j}.jpg"
+
+# Function to slice a single image into patches, returning the saved patch paths and the number of blank tiles skipped;
+# images large enough for the page store are memory-mapped and tiled window by window
+def slice_image(img_path, patches_dir, min_ink_fraction=0, ink_threshold=160, page_store=None):
+    filename = os.path.basename(img_path)
+    store_name = f"slice_{filename.split('.')[0]}"
+    mapped = page_store is not None and page_store.should_store(img_path)
+    if mapped:
+        img = page_store.import_image(store_name, img_path)
+    else:
+        img = Image.open(img_path)
+        img = np.array(img)
+
+    # Create patches
+    patches = tile_image(img)
+
+    # Skip near-empty tiles (blank paper) so no model ever runs on them
+    content_tiles = find_content_tiles(img, min_ink_fraction, ink_threshold)
+
+    # Save patches
+    patch_paths = []
+    for i in range(patches.shape[0]):
+        for j in range(patches.shape[1]):
+            if not content_tiles[i, j]:
+                continue
+            single_patch = patches[i, j]
+            patch_filename = patch_filename_for(filename, i, j)
+            patch_filepath = os.path.join(patches_dir, patch_filename)
+            Image.fromarray(np.uint8(single_patch)).save(patch_filepath)
+            patch_paths.append(patch_filepath)
+
+    if mapped:
+        # Drop every view of the mapped page before deleting its backing file
+        img = patches = single_patch = None
+        page_store.remove(store_name)
+    return patch_paths, int((~content_tiles).sum())
+
+# Function to slice images in a directory, optionally only the given filenames
+def slice_images(image_dir, patches_dir, min_ink_fraction=0, ink_threshold=160, filenames=None, page_store=None):
     # Create output directory if it doesn't exist
     if not os.path.exists(patches_dir):
         os.makedirs(patches_dir)
 
-    for filename in os.listdir(image_dir):
+    skipped_tiles = 0
+    patch_paths_by_image = {}
+    for filename in (filenames if filenames is not None else os.listdir(image_dir)):
         if filename.endswith(".jpg"): 
             img_path = os.path.join(image_dir, filename)
-            img = Image.open(img_path)
-            img = np.array(img)
-
-            # Create patches
-            patches = patchify(img, patch_size, step=step_size)
-
-            # Save patches
-            for i in range(patches.shape[0]):
-                for j in range(patches.shape[1]):
-                    single_patch = patches[i, j, :, :, :]
-                    single_patch = np.squeeze(single_patch)  # Remove single-dimensional entries from the shape of an array.
-                    patch_filename = f"{filename.split('.')[0]}_patch_{i}_{j}.jpg"
-                    patch_filepath = os.path.join(patches_dir, patch_filename)
-                    Image.fromarray(np.uint8(single_patch)).save(patch_filepath)
+            patch_paths, skipped = slice_image(img_path, patches_dir, min_ink_fraction, ink_threshold, page_store)
+            patch_paths_by_image[filename] = patch_paths
+            skipped_tiles += skipped
 
+    if skipped_tiles:
+        print(f"Skipped {skipped_tiles} blank tiles")
+    return skipped_tiles, patch_paths_by_image
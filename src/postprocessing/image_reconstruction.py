@@ -1,89 +1,97 @@
 # Description: Script to reconstruct image from patches
+# Patches are grouped in a single directory scan, decoded in a thread pool and written straight into a
+# preallocated canvas; several drawings are reconstructed in parallel
 # Import necessary libraries
 import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
+from src.postprocessing.page_aggregation import parse_patch_filename
+from src.utils.page_store import save_page
+
 # Define the size of patches to split each image into
 patch_size = (448, 448, 3)
 step_size = 416  # Step size for patchifying
 
-# Function to reconstruct images from patches
-def reconstruct_images(patches_dir, output_dir):
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Collect all patch filenames
-    patch_files = [f for f in os.listdir(patches_dir) if f.endswith(".jpg")]
-
-    if not patch_files:
-        print(f"No patch files found in {patches_dir}. Exiting reconstruction process.")
-        return None
-
-    # Group patches by base name
+# Function to group the patch files of a directory by drawing in one scan, returning base name -> [(i, j, path)]
+def group_patch_files(patches_dir):
     patches_by_base_name = {}
-    for filename in patch_files:
-        if '_patch_' in filename:
-            parts = filename.split('_patch_')
-            base_name = parts[0]
-            if base_name not in patches_by_base_name:
-                patches_by_base_name[base_name] = []
-            patches_by_base_name[base_name].append(filename)
+    with os.scandir(patches_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.jpg') or not entry.is_file():
+                continue
+            base_name, i, j = parse_patch_filename(entry.name)
+            if base_name is not None:
+                patches_by_base_name.setdefault(base_name, []).append((i, j, entry.path))
+    return patches_by_base_name
 
-    # Reconstruct images for each base name
-    for base_name, filenames in patches_by_base_name.items():
-        print(f"Reconstructing image for base name: {base_name}")
+# Function to decode one patch file into an RGB array
+def _decode_patch(patch_filepath):
+    with Image.open(patch_filepath) as patch_img:
+        return np.array(patch_img.convert('RGB'))
 
-        # Extract patch IDs from filenames
-        patch_ids = []
-        for filename in filenames:
-            parts = filename.split('_patch_')
-            ij_part = parts[1].split('.')[0]
-            i, j = map(int, ij_part.split('_'))
-            patch_id = (i, j)
-            patch_ids.append(patch_id)
+# Function to reconstruct one drawing from its patches, decoding them in decode_pool; returns the output path or None
+def reconstruct_image(base_name, patches, output_dir, decode_pool, page_store=None, chunk_size=64):
+    print(f"Reconstructing image for base name: {base_name}")
 
-        if not patch_ids:
-            print(f"No valid patch IDs extracted from filenames for {base_name}. Skipping.")
-            continue
+    # Determine image dimensions based on patch IDs
+    max_i = max(i for i, _, _ in patches) + 1
+    max_j = max(j for _, j, _ in patches) + 1
+    img_height = max_i * step_size + patch_size[0] - step_size
+    img_width = max_j * step_size + patch_size[1] - step_size
 
-        # Determine image dimensions based on patch IDs
-        max_i = max(patch_ids, key=lambda x: x[0])[0] + 1
-        max_j = max(patch_ids, key=lambda x: x[1])[1] + 1
-        img_height = max_i * step_size + patch_size[0] - step_size
-        img_width = max_j * step_size + patch_size[1] - step_size
-        #print(f"Determined image dimensions: height={img_height}, width={img_width}")
-        reconstructed_img = np.zeros((img_height, img_width, 3), dtype=np.uint8)
+    # Start from white paper so tiles skipped as blank during slicing reconstruct as blank
+    mapped = page_store is not None and img_height * img_width >= page_store.min_pixels
+    if mapped:
+        reconstructed_img = page_store.create(f"reconstruct_{base_name}", (img_height, img_width, 3), fill=255)
+    else:
+        reconstructed_img = np.full((img_height, img_width, 3), 255, dtype=np.uint8)
 
-        # Load patches and reconstruct image
-        for patch_id in patch_ids:
-            i, j = patch_id
-            patch_filename = f"{base_name}_patch_{i}_{j}.jpg"
-            patch_filepath = os.path.join(patches_dir, patch_filename)
-            
-            if not os.path.exists(patch_filepath):
-                #print(f"Patch file {patch_filename} not found. Skipping this patch.")
-                continue
-            
-            patch_img = Image.open(patch_filepath)
-            patch_img = np.array(patch_img)
+    # Patches overlap, so place them in row-major order for a deterministic result; decoding runs ahead in the pool
+    # one bounded chunk at a time. Placements are counted so emptiness needs no pass over the canvas
+    patches = sorted(patches)
+    placed_patches = 0
+    for start in range(0, len(patches), chunk_size):
+        chunk = patches[start:start + chunk_size]
+        decoded = decode_pool.map(_decode_patch, [patch_filepath for _, _, patch_filepath in chunk])
+        for (i, j, _), patch_img in zip(chunk, decoded):
             start_i = i * step_size
             start_j = j * step_size
-            end_i = start_i + patch_img.shape[0]
-            end_j = start_j + patch_img.shape[1]
-            #print(f"Placing patch {patch_filename} at: start_i={start_i}, end_i={end_i}, start_j={start_j}, end_j={end_j}")
-            reconstructed_img[start_i:end_i, start_j:end_j, :] = patch_img
-
-        if np.max(reconstructed_img) == 0:
-            #print(f"Reconstructed image for {base_name} is empty. Check patch loading and dimensions.")
-            continue
+            reconstructed_img[start_i:start_i + patch_img.shape[0], start_j:start_j + patch_img.shape[1], :] = patch_img
+            placed_patches += 1
 
-        # Save reconstructed image
-        reconstructed_img = Image.fromarray(reconstructed_img)
+    # Save reconstructed image
+    output_path = None
+    if placed_patches > 0:
         output_path = os.path.join(output_dir, f'reconstructed_{base_name}.jpg')
-        reconstructed_img.save(output_path)
-        #print(f"Reconstructed image saved to: {output_path}")
+        save_page(reconstructed_img, output_path)
+    #else: print(f"Reconstructed image for {base_name} is empty. Check patch loading and dimensions.")
 
-    return output_dir
+    if mapped:
+        reconstructed_img = None
+        page_store.remove(f"reconstruct_{base_name}")
+    return output_path
+
+# Function to reconstruct images from patches; canvases large enough for the page store are memory-mapped
+def reconstruct_images(patches_dir, output_dir, page_store=None, workers=4, decode_workers=8):
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Group all patch files by base name in one directory scan
+    patches_by_base_name = group_patch_files(patches_dir)
 
+    if not patches_by_base_name:
+        print(f"No patch files found in {patches_dir}. Exiting reconstruction process.")
+        return None
+
+    # Reconstruct the drawings in parallel; all of them share one pool of patch decoders
+    with ThreadPoolExecutor(max_workers=max(1, decode_workers), thread_name_prefix='patch-decode') as decode_pool, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='reconstruct') as drawing_pool:
+        futures = [drawing_pool.submit(reconstruct_image, base_name, patches, output_dir, decode_pool, page_store)
+                   for base_name, patches in sorted(patches_by_base_name.items())]
+        for future in futures:
+            future.result()
+
+    return output_dir
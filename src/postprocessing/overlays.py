@@ -0,0 +1,116 @@
+# Description: Vector overlays. Detections are kept as data in page coordinates and exported once per drawing as
+# GeoJSON and SVG layers, which the viewer draws over the original image on request instead of boxes being burned
+# into re-encoded patch and page rasters.
+# Import necessary libraries
+import json
+import os
+import threading
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.postprocessing.page_aggregation import parse_patch_filename, to_page_coordinates
+
+# Overlay layers with their outline colour (RGB) and line width, matching the burned-in rasters
+LAYER_STYLES = {
+    'symbols': ((255, 0, 0), 4),
+    'text': ((0, 255, 0), 2),
+}
+
+# Function to build the overlay layers of one drawing from its page-level symbols and per-patch (box, text) OCR results
+def build_layers(page_objects, text_results):
+    symbols = [
+        {'bbox': [float(c) for c in detection['bbox_coordinates']], 'class_label': int(detection['class_label']),
+         'class_name': detection['class_name'], 'confidence': float(detection['confidence_score'])}
+        for detection in page_objects
+    ]
+    text = []
+    for patch_filename, results in text_results.items():
+        _, i, j = parse_patch_filename(patch_filename)
+        for box, ocr_text in results:
+            page_box = to_page_coordinates(box, i, j)[0] if i is not None else box
+            text.append({'bbox': [float(c) for c in page_box], 'text': ocr_text})
+    return {'symbols': symbols, 'text': text}
+
+# Function to convert overlay layers to a GeoJSON FeatureCollection in image pixel coordinates (y pointing down)
+def layers_to_geojson(layers, width, height):
+    features = []
+    for layer, items in layers.items():
+        for item in items:
+            (startX, startY, endX, endY) = item['bbox']
+            ring = [[startX, startY], [endX, startY], [endX, endY], [startX, endY], [startX, startY]]
+            properties = {'layer': layer, **{name: value for name, value in item.items() if name != 'bbox'}}
+            features.append({'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': properties})
+    return {'type': 'FeatureCollection', 'image_size': [width, height], 'features': features}
+
+# Function to save overlay layers as GeoJSON
+def save_geojson(geojson_path, layers, width, height):
+    with open(geojson_path, 'w', encoding='utf-8') as geojson_file:
+        json.dump(layers_to_geojson(layers, width, height), geojson_file)
+
+# Function to load overlay layers saved by save_geojson, returning (layers, width, height)
+def load_geojson(geojson_path):
+    with open(geojson_path, 'r', encoding='utf-8') as geojson_file:
+        collection = json.load(geojson_file)
+    layers = {layer: [] for layer in LAYER_STYLES}
+    for feature in collection['features']:
+        ring = feature['geometry']['coordinates'][0]
+        properties = dict(feature['properties'])
+        layer = properties.pop('layer')
+        layers.setdefault(layer, []).append({'bbox': [ring[0][0], ring[0][1], ring[2][0], ring[2][1]], **properties})
+    width, height = collection.get('image_size', [None, None])
+    return layers, width, height
+
+# Function to save overlay layers as an SVG with one group per layer, sized to lie exactly over the original image
+def save_svg(svg_path, layers, width, height):
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">']
+    for layer, items in layers.items():
+        (colour, line_width) = LAYER_STYLES.get(layer, ((0, 0, 255), 2))
+        lines.append(f'<g id={quoteattr(layer)} fill="none" stroke="rgb{colour}" stroke-width="{line_width}">')
+        for item in items:
+            (startX, startY, endX, endY) = item['bbox']
+            title = item.get('class_name') or item.get('text') or ''
+            lines.append(f'<rect x="{startX:.1f}" y="{startY:.1f}" width="{endX - startX:.1f}" height="{endY - startY:.1f}">'
+                         f'<title>{escape(title)}</title></rect>')
+        lines.append('</g>')
+    lines.append('</svg>')
+    with open(svg_path, 'w', encoding='utf-8') as svg_file:
+        svg_file.write('\n'.join(lines))
+
+# Function to write the GeoJSON and SVG overlays of one drawing, returning their paths
+def export_overlays(output_dir, base_name, layers, width, height):
+    os.makedirs(output_dir, exist_ok=True)
+    geojson_path = os.path.join(output_dir, f"overlays_{base_name}.geojson")
+    svg_path = os.path.join(output_dir, f"overlays_{base_name}.svg")
+    save_geojson(geojson_path, layers, width, height)
+    save_svg(svg_path, layers, width, height)
+    return [geojson_path, svg_path]
+
+# Function to draw the visible overlay layers onto a copy of a PIL image; scale maps page coordinates onto the image
+def render_layers(image, layers, visible_layers=None, scale=1):
+    rendered = image.convert('RGB')
+    draw = ImageDraw.Draw(rendered)
+    for layer, items in layers.items():
+        if visible_layers is not None and layer not in visible_layers:
+            continue
+        (colour, line_width) = LAYER_STYLES.get(layer, ((0, 0, 255), 2))
+        for item in items:
+            (startX, startY, endX, endY) = (int(c * scale) for c in item['bbox'])
+            draw.rectangle([startX, startY, endX, endY], outline=colour, width=line_width)
+    return rendered
+
+# Function to draw the visible overlay layers over a drawing's original image for viewing. Pages large enough for
+# the page store are mapped there and subsampled to at most max_size pixels a side, so they never sit in RAM whole
+def render_overlay_preview(image_path, layers, visible_layers=None, page_store=None, max_size=4096):
+    if page_store is None or not page_store.should_store(image_path):
+        with Image.open(image_path) as image:
+            return render_layers(image, layers, visible_layers)
+
+    # Sessions may view the same drawing at once, so each thread maps its own copy
+    name = f"view_{os.path.splitext(os.path.basename(image_path))[0]}_{threading.get_ident()}"
+    page = page_store.import_image(name, image_path)
+    step = max(1, -(-max(page.shape[:2]) // max_size))
+    preview = Image.fromarray(np.ascontiguousarray(page[::step, ::step]))
+    del page
+    page_store.remove(name)
+    return render_layers(preview, layers, visible_layers, scale=1 / step)
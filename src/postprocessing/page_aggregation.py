@@ -0,0 +1,141 @@
+# Description: Aggregates per-patch detections into page coordinates and removes duplicates on patch seams
+# with a vectorised non-maximum suppression across the overlap bands of neighbouring patches.
+# Import necessary libraries
+import re
+import numpy as np
+
+from src.postprocessing.image_deconstruction import patch_size, step_size
+
+# Width of the band along each patch edge that neighbouring patches also cover
+overlap_size = patch_size[0] - step_size
+
+# Function to split a patch filename into its base name and (i, j) patch indices
+def parse_patch_filename(patch_filename):
+    match = re.search(r'^(.+)_patch_(\d+)_(\d+)\.jpg$', patch_filename)
+    if match:
+        return match.group(1), int(match.group(2)), int(match.group(3))
+    else:
+        return None, None, None
+
+# Function to translate (N, 4) patch-local xyxy boxes of patch (i, j) into page coordinates
+def to_page_coordinates(boxes, i, j):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return boxes + np.array([j * step_size, i * step_size, j * step_size, i * step_size], dtype=np.float32)
+
+# Function to find which (N, 4) patch-local xyxy boxes reach into the band a neighbouring patch also covers;
+# only these can have a duplicate in another patch
+def in_overlap_band(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return (boxes[:, 0] < overlap_size) | (boxes[:, 1] < overlap_size) | (boxes[:, 2] > step_size) | (boxes[:, 3] > step_size)
+
+# Function to run greedy non-maximum suppression over (N, 4) xyxy boxes, optionally per class; with groups (e.g. the
+# patch of each box) a box only suppresses boxes of other groups
+def non_max_suppression(boxes, scores, overlap_threshold=0.5, classes=None, metric='iou', groups=None):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    if groups is not None:
+        groups = np.asarray(groups).reshape(-1)
+
+    # Shift each class into its own coordinate range so one pass never suppresses across classes
+    if classes is not None:
+        offsets = np.asarray(classes, dtype=np.float32).reshape(-1, 1) * (boxes.max() - boxes.min() + 1.0)
+        boxes = boxes + offsets
+
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while len(order) > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        # Overlap of the best box with every remaining box in one vectorised step
+        inter_w = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        inter_h = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        inter = inter_w * inter_h
+        if metric == 'iomin':
+            # Intersection over the smaller box, so a box cut off at a seam matches its complete copy
+            overlap = inter / np.maximum(np.minimum(areas[best], areas[rest]), 1e-6)
+        else:
+            overlap = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-6)
+        suppressed = overlap > overlap_threshold
+        if groups is not None:
+            suppressed &= groups[rest] != groups[best]
+        order = rest[~suppressed]
+
+    return np.array(keep, dtype=np.int64)
+
+# Function to keep the boxes of one drawing that are not seam duplicates: boxes away from the patch edges are always
+# kept, boxes in the overlap bands go through NMS that only suppresses boxes of another patch
+def _suppress_seam_duplicates(page_boxes, local_boxes, scores, patch_ids, overlap_threshold, metric, classes=None):
+    band = np.nonzero(in_overlap_band(local_boxes))[0]
+    keep = np.ones(len(page_boxes), dtype=bool)
+    keep[band] = False
+    band_keep = non_max_suppression(page_boxes[band], np.asarray(scores, dtype=np.float32)[band], overlap_threshold,
+                                    classes=None if classes is None else np.asarray(classes)[band], metric=metric,
+                                    groups=np.asarray(patch_ids)[band])
+    keep[band[band_keep]] = True
+    return np.nonzero(keep)[0]
+
+# Function to merge YOLOv5 patch detections into one deduplicated detection set per drawing
+def aggregate_object_boxes(object_boxes, overlap_threshold=0.7, metric='iomin'):
+    # Collect every patch box in page coordinates, grouped by drawing
+    candidates_by_page = {}
+    for patch_filename, boxes in object_boxes.items():
+        base_name, i, j = parse_patch_filename(patch_filename)
+        if base_name is None:
+            continue
+        for box in boxes:
+            xyxy = [float(c) for c in box['bbox_coordinates']]
+            page_box = to_page_coordinates(xyxy, i, j)[0]
+            candidates_by_page.setdefault(base_name, []).append((page_box, xyxy, patch_filename, box))
+
+    # Run per-class NMS across the patch seams of each drawing
+    page_detections = {}
+    for base_name, candidates in candidates_by_page.items():
+        page_boxes = np.stack([page_box for page_box, _, _, _ in candidates])
+        local_boxes = [xyxy for _, xyxy, _, _ in candidates]
+        scores = [box['confidence_score'] for _, _, _, box in candidates]
+        classes = [box['class_label'] for _, _, _, box in candidates]
+        patch_ids = [patch_filename for _, _, patch_filename, _ in candidates]
+        keep = _suppress_seam_duplicates(page_boxes, local_boxes, scores, patch_ids, overlap_threshold, metric, classes)
+
+        detections = []
+        for index in keep:
+            page_box, _, _, box = candidates[index]
+            detection = dict(box)
+            detection['patch_filename'] = box['image_filename']
+            detection['image_filename'] = base_name
+            detection['bbox_coordinates'] = [float(c) for c in page_box]
+            detections.append(detection)
+        page_detections[base_name] = detections
+
+    return page_detections
+
+# Function to remove duplicate text boxes on patch seams before OCR, returning the kept boxes per patch
+def deduplicate_text_boxes(text_boxes, overlap_threshold=0.7, metric='iomin'):
+    # Collect every patch box in page coordinates, grouped by drawing
+    candidates_by_page = {}
+    for patch_filename, boxes in text_boxes.items():
+        base_name, i, j = parse_patch_filename(patch_filename)
+        for box in boxes:
+            page_box = to_page_coordinates(box, i, j)[0] if base_name is not None else np.asarray(box, dtype=np.float32)
+            candidates_by_page.setdefault(base_name or patch_filename, []).append((page_box, patch_filename, box))
+
+    # EAST confidences are not kept after per-patch NMS, so prefer the larger box:
+    # a box cut off by a patch edge is smaller than its complete copy in the neighbouring patch.
+    # Boxes within one patch were already deduplicated by EAST's own NMS and are never suppressed here
+    kept_boxes = {patch_filename: [] for patch_filename in text_boxes}
+    for candidates in candidates_by_page.values():
+        page_boxes = np.stack([page_box for page_box, _, _ in candidates])
+        areas = (page_boxes[:, 2] - page_boxes[:, 0]) * (page_boxes[:, 3] - page_boxes[:, 1])
+        local_boxes = [box for _, _, box in candidates]
+        patch_ids = [patch_filename for _, patch_filename, _ in candidates]
+        keep = set(_suppress_seam_duplicates(page_boxes, local_boxes, areas, patch_ids, overlap_threshold, metric).tolist())
+        for index, (_, patch_filename, box) in enumerate(candidates):
+            if index in keep:
+                kept_boxes[patch_filename].append(box)
+
+    return kept_boxes
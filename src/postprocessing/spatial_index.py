@@ -0,0 +1,162 @@
+# Description: Spatial index over the page-coordinate boxes of one drawing, answering nearest-box and region
+# queries through a k-d tree over box centres, and the symbol-to-tag association built on it: each YOLO symbol is
+# paired with the nearest OCR text region, in O(n log n) instead of a pairwise scan of every symbol against every text.
+# Import necessary libraries
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from src.postprocessing.overlays import load_geojson
+
+# Columns of the symbol-tag association table
+ASSOCIATION_COLUMNS = ['drawing', 'symbol_id', 'class_name', 'confidence', 'symbol_x0', 'symbol_y0', 'symbol_x1', 'symbol_y1',
+                       'tag', 'tag_x0', 'tag_y0', 'tag_x1', 'tag_y1', 'distance']
+
+# Function to compute the gap between one box and (N, 4) xyxy boxes: 0 when they overlap, else the edge-to-edge distance
+def box_distances(box, boxes):
+    dx = np.maximum(np.maximum(boxes[:, 0] - box[2], box[0] - boxes[:, 2]), 0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - box[3], box[1] - boxes[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+# Spatial index over (N, 4) xyxy boxes in page coordinates
+class SpatialIndex:
+    def __init__(self, boxes):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.centres = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+        # Largest half width and half height, so a region query on centres can be widened to catch every overlap
+        self.max_half_size = (self.boxes[:, 2:] - self.boxes[:, :2]).max(axis=0) / 2 if len(self.boxes) else np.zeros(2)
+        self.tree = cKDTree(self.centres) if len(self.boxes) else None
+
+    def __len__(self):
+        return len(self.boxes)
+
+    # Up to k nearest boxes to each query box by edge-to-edge distance, as (indices, distances) arrays of shape
+    # (M, k), nearest first; missing neighbours have index -1 and distance inf
+    def nearest(self, query_boxes, k=1, candidates=8, max_distance=np.inf):
+        query_boxes = np.asarray(query_boxes, dtype=np.float32).reshape(-1, 4)
+        indices = np.full((len(query_boxes), k), -1, dtype=np.int64)
+        distances = np.full((len(query_boxes), k), np.inf, dtype=np.float32)
+        if self.tree is None or len(query_boxes) == 0:
+            return indices, distances
+
+        # A gap of d between two boxes means their centres are at most d plus both half diagonals apart
+        query_half_diagonals = np.hypot(*((query_boxes[:, 2:] - query_boxes[:, :2]).T / 2))
+        slack = query_half_diagonals + np.hypot(*self.max_half_size)
+        query_centres = (query_boxes[:, :2] + query_boxes[:, 2:]) / 2
+
+        # First pass: the boxes with the closest centres give an upper bound on the k-th smallest gap
+        candidates = min(max(candidates, k), len(self.boxes))
+        _, candidate_indices = self.tree.query(query_centres, k=candidates, distance_upper_bound=max_distance + slack.max())
+        candidate_indices = np.asarray(candidate_indices).reshape(len(query_boxes), candidates)
+        bounds = np.full(len(query_boxes), max_distance, dtype=np.float64)
+        for row, (box, row_candidates) in enumerate(zip(query_boxes, candidate_indices)):
+            row_candidates = row_candidates[row_candidates < len(self.boxes)]
+            if len(row_candidates) >= k:
+                bounds[row] = min(max_distance, np.sort(box_distances(box, self.boxes[row_candidates]))[k - 1])
+
+        # Second pass: every box whose centre lies within the bound plus the slack, ranked by exact gap
+        for row, row_candidates in enumerate(self.tree.query_ball_point(query_centres, bounds + slack)):
+            row_candidates = np.array(row_candidates, dtype=np.int64)
+            if len(row_candidates) == 0:
+                continue
+            gaps = box_distances(query_boxes[row], self.boxes[row_candidates])
+            order = np.lexsort((row_candidates, gaps))
+            order = order[gaps[order] <= max_distance][:k]
+            indices[row, :len(order)] = row_candidates[order]
+            distances[row, :len(order)] = gaps[order]
+        return indices, distances
+
+    # Indices of the boxes that intersect an xyxy region
+    def query_region(self, region):
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64)
+        (x0, y0, x1, y1) = region
+        # Chebyshev ball around the region centre that holds the centre of every box that can touch the region
+        radius = max((x1 - x0) / 2 + self.max_half_size[0], (y1 - y0) / 2 + self.max_half_size[1])
+        candidates = np.array(self.tree.query_ball_point([(x0 + x1) / 2, (y0 + y1) / 2], radius, p=np.inf), dtype=np.int64)
+        if len(candidates) == 0:
+            return candidates
+        boxes = self.boxes[candidates]
+        inside = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return np.sort(candidates[inside])
+
+# Function to pair each symbol of one drawing's overlay layers with its nearest text region, returning a list of
+# (symbol index, text index or None, distance). With unique_tags each text is given to at most one symbol, the
+# closest pairs first; tag_pattern keeps only texts that look like tags (e.g. FV-101)
+def associate_tags(layers, max_distance=150, candidates=8, tag_pattern=None, unique_tags=True):
+    symbols = layers.get('symbols', [])
+    texts = layers.get('text', [])
+    text_ids = [t for t, item in enumerate(texts) if item.get('text', '').strip()
+                and (tag_pattern is None or re.search(tag_pattern, item['text']))]
+    index = SpatialIndex([texts[t]['bbox'] for t in text_ids])
+    symbol_boxes = [item['bbox'] for item in symbols]
+    neighbours, distances = index.nearest(symbol_boxes, k=candidates if unique_tags else 1, candidates=candidates,
+                                          max_distance=max_distance)
+
+    pairs = {}
+    if unique_tags:
+        # Greedy matching over every (symbol, candidate text) pair, shortest gap first
+        symbol_ids, ranks = np.nonzero(neighbours >= 0)
+        order = np.argsort(distances[symbol_ids, ranks], kind='stable')
+        taken = set()
+        for s, r in zip(symbol_ids[order], ranks[order]):
+            t = int(neighbours[s, r])
+            if s in pairs or t in taken:
+                continue
+            pairs[s] = (text_ids[t], float(distances[s, r]))
+            taken.add(t)
+    else:
+        for s in np.nonzero(neighbours[:, 0] >= 0)[0]:
+            pairs[s] = (text_ids[int(neighbours[s, 0])], float(distances[s, 0]))
+
+    return [(s, *pairs.get(s, (None, None))) for s in range(len(symbols))]
+
+# Function to build the symbol-tag association table of one drawing as a DataFrame
+def association_table(drawing, layers, **options):
+    symbols = layers.get('symbols', [])
+    texts = layers.get('text', [])
+    rows = []
+    for s, t, distance in associate_tags(layers, **options):
+        symbol = symbols[s]
+        tag_box = texts[t]['bbox'] if t is not None else [None] * 4
+        rows.append([drawing, s, symbol.get('class_name'), symbol.get('confidence'), *symbol['bbox'],
+                     ' '.join(texts[t]['text'].split()) if t is not None else None, *tag_box, distance])
+    return pd.DataFrame(rows, columns=ASSOCIATION_COLUMNS)
+
+# Function to rebuild overlay layers per drawing from a detections store DataFrame
+def layers_from_detections(df):
+    layers_by_drawing = {}
+    for drawing, rows in df.groupby('drawing', sort=True):
+        boxes = rows[['x0', 'y0', 'x1', 'y1']].to_numpy(dtype=np.float32).tolist()
+        is_symbol = (rows['stage'] == 'yolo').to_numpy()
+        layers_by_drawing[drawing] = {
+            'symbols': [{'bbox': box, 'class_name': name, 'confidence': confidence}
+                        for box, name, confidence, symbol in zip(boxes, rows['class_name'], rows['confidence'], is_symbol) if symbol],
+            'text': [{'bbox': box, 'text': text or ''} for box, text, symbol in zip(boxes, rows['text'], is_symbol) if not symbol],
+        }
+    return layers_by_drawing
+
+# Function to build the symbol-tag association table of every drawing, from the detections store when one is in use,
+# otherwise from the overlays_*.geojson files in output_dir, and save it as symbol_tags.csv in output_dir
+def save_symbol_tags(output_dir, detections_store=None, association_config=None):
+    association_config = association_config or {}
+    options = dict(max_distance=association_config.get('max_distance', 150), candidates=association_config.get('candidates', 8),
+                   tag_pattern=association_config.get('tag_pattern'), unique_tags=association_config.get('unique_tags', True))
+    if detections_store is not None:
+        layers_by_drawing = layers_from_detections(detections_store.read())
+    else:
+        layers_by_drawing = {}
+        for geojson_path in sorted(glob.glob(os.path.join(output_dir, 'overlays_*.geojson'))):
+            drawing = os.path.basename(geojson_path)[len('overlays_'):-len('.geojson')]
+            layers_by_drawing[drawing] = load_geojson(geojson_path)[0]
+
+    tables = [association_table(drawing, layers, **options) for drawing, layers in layers_by_drawing.items()]
+    associations_df = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=ASSOCIATION_COLUMNS)
+    os.makedirs(output_dir, exist_ok=True)
+    associations_csv = os.path.join(output_dir, 'symbol_tags.csv')
+    associations_df.to_csv(associations_csv, index=False)
+    print(f"Symbol-tag associations saved to: {associations_csv}")
+    return associations_df
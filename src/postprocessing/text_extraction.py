@@ -1,19 +1,77 @@
 # Description: This script is used to process text files created by Tesseract OCR and store the extracted text in a DataFrame.
+# Consolidation is incremental: an index of per-file texts is kept next to the text files, so a run only reads the files
+# that are new or changed since the last one, and cleaning and aggregation are vectorised over the whole table.
 # Import necessary libraries
+import json
 import os
 import pandas as pd
 import re
 
+# Index of per-file texts kept in the text detection directory, keyed by text file name
+TEXT_INDEX_FILENAME = 'consolidated_text_index.json'
+CONSOLIDATED_CSV_FILENAME = 'consolidated_extracted_text.csv'
+
+# Text files written by EASTTextDetector are named text_extraction_<drawing>_patch_<i>_<j>.jpg.txt
+TEXT_FILE_PATTERN = r'^text_extraction_(?P<filename>.+)_patch_(?P<i>\d+)_(?P<j>\d+)\.jpg\.txt$'
+
+# Consolidated text per directory from the last call in this process, with the index it was built from
+_consolidated_cache = {}
+
+# Function to load the index of per-file texts of a directory, mapping file name -> [mtime_ns, size, text]
+def load_text_index(directory):
+    index_path = os.path.join(directory, TEXT_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError) as e:
+        print(f"Could not read text index {index_path}: {e}. Rebuilding it.")
+        return {}
+
+# Function to save the index of per-file texts of a directory
+def save_text_index(directory, index):
+    index_path = os.path.join(directory, TEXT_INDEX_FILENAME)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    os.replace(tmp_path, index_path)
+
+# Function to bring an index up to date with the text files in a directory in one streaming scan, reading only the
+# files that are new or whose modification time or size changed; returns (index, changed)
+def scan_text_files(directory, index):
+    updated_index = {}
+    read_files = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("text_extraction_") and entry.name.endswith(".txt")):
+                continue
+            stat = entry.stat()
+            previous = index.get(entry.name)
+            if previous is not None and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+                updated_index[entry.name] = previous
+                continue
+            with open(entry.path, 'r', encoding='utf-8') as file:
+                updated_index[entry.name] = [stat.st_mtime_ns, stat.st_size, file.read()]
+            read_files += 1
+    changed = read_files > 0 or len(updated_index) != len(index)
+    return updated_index, changed
+
 # Function to load text files created by Tesseract OCR
 def load_text_files(directory):
-    text_files = []
-    for filename in os.listdir(directory):
-        if filename.startswith("text_extraction_") and filename.endswith(".txt"):
-            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
-                text = file.read().strip()
-                patch_id, original_filename = extract_patch_and_original_filename(filename)  # Extract patch ID and original filename
-                text_files.append({'patch_id': patch_id, 'filename': original_filename, 'text': text})
-    return pd.DataFrame(text_files)
+    index, _ = scan_text_files(directory, load_text_index(directory))
+    return text_index_to_frame(index)
+
+# Function to convert an index of per-file texts into a [patch_id, filename, text] DataFrame in patch order
+def text_index_to_frame(index):
+    df = pd.DataFrame({'text_file': list(index.keys()), 'text': [entry[2] for entry in index.values()]})
+    parts = df['text_file'].str.extract(TEXT_FILE_PATTERN)
+    df['filename'] = parts['filename']
+    df['patch_id'] = parts['i'] + '_' + parts['j']
+    df['i'] = pd.to_numeric(parts['i'])
+    df['j'] = pd.to_numeric(parts['j'])
+    df = df.dropna(subset=['filename']).sort_values(['filename', 'i', 'j'], kind='stable')
+    return df[['patch_id', 'filename', 'text']].reset_index(drop=True)
 
 # Function to extract patch ID and original filename from file name
 def extract_patch_and_original_filename(filename):
@@ -32,24 +90,59 @@ def clean_text(text):
     text = ' '.join(text.split())   # Remove extra whitespace
     return text
 
-# Main function to process text files and store in DataFrame
-def process_text_files(text_detection_dir):
-    df = load_text_files(text_detection_dir)
-    
-    if df.empty or 'text' not in df.columns:
-        print(f"No text files found or 'text' column missing in DataFrame from {text_detection_dir}.")
-        return pd.DataFrame()  # Return empty DataFrame or handle the error as needed
-    
-    df['cleaned_text'] = df['text'].apply(clean_text)
-    
-    # Consolidate extracted text based on original filename
-    consolidated_df = df.groupby('filename')['cleaned_text'].apply(lambda x: ' '.join(x)).reset_index()
+# Function to clean a column of texts at once: whitespace runs (including newlines) collapse to one space
+def clean_text_series(texts):
+    return texts.fillna('').str.replace(r'\s+', ' ', regex=True).str.strip()
+
+# Function to join the cleaned texts of each drawing, skipping patches without text
+def consolidate_frame(df):
+    cleaned = df.assign(cleaned_text=clean_text_series(df['text']))
+    cleaned = cleaned[cleaned['cleaned_text'] != '']
+    consolidated_df = cleaned.groupby('filename', sort=True)['cleaned_text'].agg(' '.join).reset_index()
     consolidated_df.columns = ['filename', 'consolidated_text']
-    
-    # Save the consolidated extracted text to a CSV file
-    consolidated_csv_filename = os.path.join(text_detection_dir, 'consolidated_extracted_text.csv')
+    return consolidated_df
+
+# Function to save the consolidated extracted text to a CSV file
+def save_consolidated_text(consolidated_df, text_detection_dir):
+    os.makedirs(text_detection_dir, exist_ok=True)
+    consolidated_csv_filename = os.path.join(text_detection_dir, CONSOLIDATED_CSV_FILENAME)
     consolidated_df.to_csv(consolidated_csv_filename, index=False)
-    
     print(f"Consolidated extracted text saved to: {consolidated_csv_filename}")
-    
-    return consolidated_df
\ No newline at end of file
+
+# Main function to process text files and store in DataFrame; only new or changed files are read, and the CSV is
+# only rewritten when the text files changed
+def process_text_files(text_detection_dir):
+    if not os.path.isdir(text_detection_dir):
+        print(f"No text files found in {text_detection_dir}.")
+        return pd.DataFrame()
+
+    directory = os.path.abspath(text_detection_dir)
+    cached_index, cached_df = _consolidated_cache.get(directory, (None, None))
+    index, changed = scan_text_files(directory, cached_index if cached_index is not None else load_text_index(directory))
+    consolidated_csv_filename = os.path.join(directory, CONSOLIDATED_CSV_FILENAME)
+    if not changed and cached_df is not None and os.path.exists(consolidated_csv_filename):
+        return cached_df
+
+    if not index:
+        if changed:
+            save_text_index(directory, index)
+        _consolidated_cache.pop(directory, None)
+        print(f"No text files found or 'text' column missing in DataFrame from {text_detection_dir}.")
+        return pd.DataFrame()  # Return empty DataFrame or handle the error as needed
+
+    consolidated_df = consolidate_frame(text_index_to_frame(index))
+    if changed or not os.path.exists(consolidated_csv_filename):
+        save_consolidated_text(consolidated_df, directory)
+        save_text_index(directory, index)
+    _consolidated_cache[directory] = (index, consolidated_df)
+    return consolidated_df
+
+# Function to consolidate extracted text from the detections store when one is in use, otherwise from the
+# per-patch text files, saving consolidated_extracted_text.csv in text_detection_dir either way
+def consolidate_text(text_detection_dir, detections_store=None):
+    if detections_store is None:
+        return process_text_files(text_detection_dir)
+
+    consolidated_df = detections_store.consolidated_text()
+    save_consolidated_text(consolidated_df, text_detection_dir)
+    return consolidated_df
@@ -1,11 +1,15 @@
 # Script to convert PDF files to images
+# Pages are rendered a few at a time so large multi-sheet scans never sit in memory all at once,
+# and PDFs are converted in parallel across a process pool
 # Importing required libraries
 import os
-import os
 import subprocess
-from pdf2image import convert_from_path
+from concurrent.futures import ProcessPoolExecutor
+from pdf2image import convert_from_path, pdfinfo_from_path
 from pathlib import Path
 
+from src.utils.config import get_config_section
+
 # Function to check if Poppler is installed
 def check_poppler():
     try:
@@ -14,28 +18,52 @@ def check_poppler():
         print("Poppler is not installed or not found in PATH.")
         raise e
 
-# Function to convert PDF to images
-def convert_pdf_to_images(pdf_path, output_format='jpg', output_folder='output_images'):
+# Function to get the number of pages in a PDF without rendering it
+def get_page_count(pdf_path):
+    return pdfinfo_from_path(pdf_path)['Pages']
+
+# Function to render a PDF thread_count pages at a time, yielding (page number, greyscale PIL image);
+# only the current chunk of pages is ever held in memory
+def iter_pdf_pages(pdf_path, dpi=200, thread_count=1):
     check_poppler() # Check if Poppler is installed
+    page_count = get_page_count(pdf_path)
+    chunk_size = max(1, int(thread_count))
+    for first_page in range(1, page_count + 1, chunk_size):
+        last_page = min(first_page + chunk_size - 1, page_count)
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page, thread_count=chunk_size)
+        for offset, image in enumerate(images):
+            yield first_page + offset, image.convert("L")
+
+# Function to name the image of one PDF page, matching the names written by convert_pdf_to_images
+def page_filename_for(pdf_path, page_number, output_format='jpg'):
+    return f"{Path(pdf_path).stem}_{page_number}.{output_format.lower()}"
+
+# Function to convert PDF to images
+def convert_pdf_to_images(pdf_path, output_format='jpg', output_folder='output_images', dpi=200, thread_count=1):
     os.makedirs(output_folder, exist_ok=True)
-    images = convert_from_path(pdf_path)
-    base_filename = Path(pdf_path).stem
-    for i, image in enumerate(images):
-        image = image.convert("L")
-        output_filename = f"{output_folder}/{base_filename}_{i + 1}.{output_format.lower()}"
+    output_paths = []
+    for page_number, image in iter_pdf_pages(pdf_path, dpi, thread_count):
+        output_filename = os.path.join(output_folder, page_filename_for(pdf_path, page_number, output_format))
         image.save(output_filename)
+        output_paths.append(output_filename)
+    return output_paths
 
-# Function to convert all PDFs in a folder to images
-def convert_all_pdfs_in_folder(input_folder, output_folder='output_images', output_format='jpg'):
+# Function to convert all PDFs in a folder to images, workers PDFs at a time
+def convert_all_pdfs_in_folder(input_folder, output_folder='output_images', output_format='jpg', dpi=200, thread_count=1, workers=1):
     pdf_files = [filename for filename in os.listdir(input_folder) if filename.lower().endswith(".pdf")]
-    for pdf_filename in pdf_files:
-        pdf_path = os.path.join(input_folder, pdf_filename)
-        convert_pdf_to_images(pdf_path, output_format=output_format, output_folder=output_folder)
-
-# Convert all PDFs in a folder to images
-input_folder = Path('C:/Users/Stuart/Python/PID_MLOPS/digitised-pid-mlops/Dataset/Demo/Original Images')
-output_folder = Path('C:/Users/Stuart/Python/PID_MLOPS/digitised-pid-mlops/Dataset/Demo/Images')
+    pdf_paths = [os.path.join(input_folder, pdf_filename) for pdf_filename in pdf_files]
+    if workers <= 1:
+        return [convert_pdf_to_images(pdf_path, output_format, output_folder, dpi, thread_count) for pdf_path in pdf_paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_pdf_to_images, pdf_path, output_format, output_folder, dpi, thread_count) for pdf_path in pdf_paths]
+        return [future.result() for future in futures]
 
-# Call the function to convert all PDFs in a folder to images
-convert_all_pdfs_in_folder(input_folder, output_folder=output_folder)
+if __name__ == "__main__":
+    # Convert all PDFs in a folder to images
+    input_folder = Path('C:/Users/Stuart/Python/PID_MLOPS/digitised-pid-mlops/Dataset/Demo/Original Images')
+    output_folder = Path('C:/Users/Stuart/Python/PID_MLOPS/digitised-pid-mlops/Dataset/Demo/Images')
+    pdf_config = get_config_section('pdf_conversion')
 
+    # Call the function to convert all PDFs in a folder to images
+    convert_all_pdfs_in_folder(input_folder, output_folder=output_folder, dpi=pdf_config.get('dpi', 200),
+                               thread_count=pdf_config.get('thread_count', 2), workers=pdf_config.get('workers', 4))
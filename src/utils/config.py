@@ -0,0 +1,28 @@
+# Description: Helper to load the project settings from configs/config.yaml.
+# Import necessary libraries
+import os
+import yaml
+
+# Repository root and default location of the project configuration file
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+CONFIG_PATH = os.path.join(PROJECT_ROOT, 'configs', 'config.yaml')
+
+# Function to load the project configuration, returning a dict of sections
+def load_config(config_path=CONFIG_PATH):
+    if not os.path.exists(config_path):
+        print(f"Config file not found: {config_path}. Using defaults.")
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as config_file:
+        return yaml.safe_load(config_file) or {}
+
+# Function to get a single config section, returning an empty dict if it is missing
+def get_config_section(section, config=None):
+    if config is None:
+        config = load_config()
+    return config.get(section) or {}
+
+# Function to resolve a path from the config relative to the repository root
+def resolve_path(path):
+    if os.path.isabs(path):
+        return path
+    return os.path.normpath(os.path.join(PROJECT_ROOT, path))
@@ -0,0 +1,119 @@
+# Description: Columnar store for the detections of a run. One Parquet dataset, partitioned by drawing, holds the
+# page-coordinate boxes, class, confidence, source stage and OCR text of every symbol and text region, replacing
+# the per-patch CSV and TXT files. Writes append new part files; reads use partition and column pruning.
+# Import necessary libraries
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columns of the detections table; drawing is the partition key
+if pa is not None:
+    DETECTIONS_SCHEMA = pa.schema([
+        ('stage', pa.string()),          # yolo for symbols, ocr for text regions
+        ('x0', pa.float32()),
+        ('y0', pa.float32()),
+        ('x1', pa.float32()),
+        ('y1', pa.float32()),
+        ('class_label', pa.int16()),     # -1 for text regions
+        ('class_name', pa.string()),
+        ('confidence', pa.float32()),    # NaN for text regions, EAST scores are not kept after NMS
+        ('text', pa.string()),
+    ])
+
+# Function to convert the overlay layers of one drawing into detection table columns
+def rows_from_layers(layers):
+    symbols = layers.get('symbols', [])
+    text = layers.get('text', [])
+    boxes = np.array([item['bbox'] for item in symbols + text], dtype=np.float32).reshape(-1, 4)
+    return {
+        'stage': ['yolo'] * len(symbols) + ['ocr'] * len(text),
+        'x0': boxes[:, 0], 'y0': boxes[:, 1], 'x1': boxes[:, 2], 'y1': boxes[:, 3],
+        'class_label': [item.get('class_label', -1) for item in symbols] + [-1] * len(text),
+        'class_name': [item['class_name'] for item in symbols] + [None] * len(text),
+        'confidence': [item['confidence'] for item in symbols] + [float('nan')] * len(text),
+        'text': [None] * len(symbols) + [item['text'] for item in text],
+    }
+
+# Function to read the OCR texts from one part file of the store, in stored order
+def read_part_texts(part_path):
+    df = pd.read_parquet(part_path, columns=['stage', 'text'])
+    return df.loc[df['stage'] == 'ocr', 'text'].fillna('').tolist()
+
+# Parquet dataset of detections under one directory, with one drawing=<name> partition per drawing
+class DetectionsStore:
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    # Directory of one drawing's partition
+    def partition_dir(self, drawing):
+        return os.path.join(self.root_dir, f"drawing={drawing}")
+
+    # Append rows (a dict of columns) to a drawing's partition as a new part file, returning its path
+    def append(self, drawing, rows):
+        table = pa.Table.from_pydict(rows, schema=DETECTIONS_SCHEMA)
+        os.makedirs(self.partition_dir(drawing), exist_ok=True)
+        part_path = os.path.join(self.partition_dir(drawing), f"part-{uuid.uuid4().hex}.parquet")
+        pq.write_table(table, part_path)
+        return part_path
+
+    # Path of the part file holding a drawing's detections as written by write_drawing
+    def drawing_path(self, drawing):
+        return os.path.join(self.partition_dir(drawing), 'detections.parquet')
+
+    # Replace a drawing's detections, e.g. after it was re-processed, returning the part file path
+    def write_drawing(self, drawing, rows):
+        self.remove(drawing)
+        os.makedirs(self.partition_dir(drawing), exist_ok=True)
+        pq.write_table(pa.Table.from_pydict(rows, schema=DETECTIONS_SCHEMA), self.drawing_path(drawing))
+        return self.drawing_path(drawing)
+
+    # Delete a drawing's partition
+    def remove(self, drawing):
+        shutil.rmtree(self.partition_dir(drawing), ignore_errors=True)
+
+    # Read detections as a DataFrame, filtered to the given drawings and stages and reading only the given columns
+    def read(self, drawings=None, stages=None, columns=None):
+        if not any(entry.name.startswith('drawing=') for entry in os.scandir(self.root_dir)):
+            return pd.DataFrame(columns=['drawing'] + DETECTIONS_SCHEMA.names if columns is None else columns)
+        # Drawing names are used verbatim as directory names, so partition values are not URI-decoded
+        partitioning = ds.HivePartitioning(pa.schema([('drawing', pa.string())]), segment_encoding='none')
+        dataset = ds.dataset(self.root_dir, format='parquet', partitioning=partitioning)
+        filters = []
+        if drawings is not None:
+            filters.append(ds.field('drawing').isin(list(drawings)))
+        if stages is not None:
+            filters.append(ds.field('stage').isin(list(stages)))
+        expression = None
+        for condition in filters:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    # Extracted text per drawing, joined in stored order, as a [filename, consolidated_text] DataFrame
+    def consolidated_text(self, drawings=None):
+        df = self.read(drawings, stages=['ocr'], columns=['drawing', 'text'])
+        if df.empty:
+            return pd.DataFrame(columns=['filename', 'consolidated_text'])
+        df['text'] = df['text'].fillna('').str.split().str.join(' ')
+        df = df[df['text'] != '']
+        consolidated_df = df.groupby('drawing', sort=True)['text'].agg(' '.join).reset_index()
+        consolidated_df.columns = ['filename', 'consolidated_text']
+        return consolidated_df
+
+# Function to open the detections store of a run directory if enabled in the detections_store section of the config
+def open_detections_store(store_config, root_dir):
+    if not store_config or not store_config.get('enabled', False):
+        return None
+    if pa is None:
+        print("pyarrow is not installed, writing per-patch CSV and TXT files instead of the detections store.")
+        return None
+    return DetectionsStore(root_dir)
@@ -0,0 +1,165 @@
+# Description: Memory-mapped page store for very large scanned drawings. Pages are kept in uncompressed TIFF
+# (or .npy) files mapped into memory, so tiling, reconstruction and overlay rendering read and write windows of a
+# page and the OS pages data in and out, instead of every drawing holding its full page in RAM.
+# Import necessary libraries
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+
+from src.utils.config import resolve_path
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+# Rows copied per step when filling a mapped page, so only one band of pixels is held in memory at a time
+BAND_ROWS = 1024
+
+# PIL's decompression-bomb limit is process-wide, so it is only raised around the page store's own Image.open calls
+_pixel_limit_lock = threading.RLock()
+
+# Context manager to open trusted high-DPI scans up to max_pixels, far beyond PIL's default limit
+@contextmanager
+def pixel_limit(max_pixels):
+    with _pixel_limit_lock:
+        previous = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = max(previous or 0, max_pixels)
+        try:
+            yield
+        finally:
+            Image.MAX_IMAGE_PIXELS = previous
+
+# Store of memory-mapped page arrays in one directory
+class PageStore:
+    def __init__(self, store_dir, fmt='tiff', min_megapixels=0, max_megapixels=2000):
+        if fmt not in ('tiff', 'npy'):
+            raise ValueError(f"Unknown page store format: {fmt}. Expected 'tiff' or 'npy'.")
+        if fmt == 'tiff' and tifffile is None:
+            print("tifffile is not installed, storing pages as .npy memory maps instead.")
+            fmt = 'npy'
+        self.store_dir = store_dir
+        self.fmt = fmt
+        self.min_pixels = min_megapixels * 1e6
+        self.max_pixels = int(max_megapixels * 1e6)
+        os.makedirs(store_dir, exist_ok=True)
+
+    # Path of the file backing a named page
+    def path(self, name):
+        return os.path.join(self.store_dir, f"{name}.{'tif' if self.fmt == 'tiff' else 'npy'}")
+
+    # Check whether an image (path or PIL image) is large enough to be memory-mapped rather than loaded into RAM
+    def should_store(self, image):
+        if isinstance(image, Image.Image):
+            width, height = image.size
+        else:
+            # Only the header is read here, not the pixels
+            with pixel_limit(self.max_pixels), Image.open(image) as img:
+                width, height = img.size
+        return width * height >= self.min_pixels
+
+    # Create a writable mapped page, optionally filled with a constant (e.g. 255 for white paper)
+    def create(self, name, shape, dtype=np.uint8, fill=None):
+        path = self.path(name)
+        if self.fmt == 'tiff':
+            page = tifffile.memmap(path, shape=shape, dtype=dtype, photometric='rgb' if len(shape) == 3 and shape[2] == 3 else 'minisblack')
+        else:
+            page = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        if fill is not None:
+            for start in range(0, shape[0], BAND_ROWS):
+                page[start:start + BAND_ROWS] = fill
+        return page
+
+    # Open an existing mapped page, read-only by default
+    def open(self, name, mode='r'):
+        if self.fmt == 'tiff':
+            return tifffile.memmap(self.path(name), mode=mode)
+        return np.load(self.path(name), mmap_mode=mode)
+
+    # Copy an image (path or PIL image) into a new mapped RGB page. TIFF scans are read one strip or tile at a
+    # time, so neither the source nor the page is ever held in RAM as a whole; other formats (JPEG, PNG) can only
+    # be decoded whole by PIL, and for them just the page written to the store is copied in bands
+    def import_image(self, name, image):
+        if not isinstance(image, Image.Image) and tifffile is not None and str(image).lower().endswith(('.tif', '.tiff')):
+            page = self._import_tiff(name, image)
+            if page is not None:
+                return page
+
+        # PIL also checks the limit when cropping, so it stays raised while the bands are copied
+        with pixel_limit(self.max_pixels):
+            img = Image.open(image) if not isinstance(image, Image.Image) else image
+            try:
+                width, height = img.size
+                page = self.create(name, (height, width, 3))
+                for start in range(0, height, BAND_ROWS):
+                    band = img.crop((0, start, width, min(start + BAND_ROWS, height))).convert('RGB')
+                    page[start:start + band.height] = np.asarray(band)
+            finally:
+                if img is not image:
+                    img.close()
+        page.flush()
+        return page
+
+    # Copy an 8-bit grey or RGB TIFF into a new mapped RGB page by windows, or return None for other TIFFs
+    def _import_tiff(self, name, path):
+        with tifffile.TiffFile(path) as tif:
+            tiff_page = tif.pages[0]
+            if (tiff_page.dtype != np.uint8 or tiff_page.planarconfig != 1 or tiff_page.samplesperpixel not in (1, 3, 4)
+                    or tiff_page.photometric not in (tifffile.PHOTOMETRIC.MINISBLACK, tifffile.PHOTOMETRIC.RGB)):
+                return None
+            height, width = tiff_page.imagelength, tiff_page.imagewidth
+            page = self.create(name, (height, width, 3))
+            if tiff_page.is_memmappable:
+                # Uncompressed pixels are mapped straight from the file and copied one band of rows at a time
+                source = tifffile.memmap(path, mode='r')
+                for start in range(0, height, BAND_ROWS):
+                    page[start:start + BAND_ROWS] = _to_rgb(source[start:start + BAND_ROWS])
+                del source
+            else:
+                # Compressed strips and tiles are decoded one at a time; edge tiles are padded past the page
+                for segment, (_, _, y, x, _), _ in tiff_page.segments():
+                    segment = segment[0, :height - y, :width - x]
+                    page[y:y + segment.shape[0], x:x + segment.shape[1]] = _to_rgb(segment)
+        page.flush()
+        return page
+
+    # Copy a page array into a new mapped page one band of rows at a time (e.g. a canvas to draw overlays on)
+    def copy_page(self, name, page):
+        copy = self.create(name, page.shape, page.dtype)
+        for start in range(0, page.shape[0], BAND_ROWS):
+            copy[start:start + BAND_ROWS] = page[start:start + BAND_ROWS]
+        return copy
+
+    # Delete a page's backing file; the caller must drop its references to the mapped array first
+    def remove(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            # Windows keeps a mapped file open until the array is garbage collected
+            print(f"Could not remove page store file {self.path(name)}, it is still mapped.")
+
+# Function to convert a window of 8-bit grey, RGB or RGBA TIFF samples to RGB
+def _to_rgb(window):
+    if window.ndim == 2 or window.shape[-1] == 1:
+        return np.repeat(window.reshape(window.shape[:2] + (1,)), 3, axis=2)
+    return window[..., :3]
+
+# Function to save a page (in RAM or mapped) as an image file; JPEG encoding needs the full page once, so this is
+# the only step where a mapped page passes through RAM as a whole
+def save_page(page, output_path):
+    Image.fromarray(np.asarray(page)).save(output_path)
+
+# Function to open the page store described by the page_store section of the config, or None if disabled
+def open_page_store(page_store_config):
+    if not page_store_config or not page_store_config.get('enabled', False):
+        return None
+    return PageStore(
+        resolve_path(page_store_config.get('dir', './outputs/page_store')),
+        page_store_config.get('format', 'tiff'),
+        page_store_config.get('min_megapixels', 100),
+        page_store_config.get('max_megapixels', 2000),
+    )
@@ -0,0 +1,141 @@
+# Description: Persistent, content-addressed cache for detection and OCR results, stored in SQLite with
+# least-recently-used eviction once the cache grows beyond a size limit.
+# Import necessary libraries
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from src.utils.config import resolve_path
+
+# Function to hash an image array by content (shape, dtype and pixels)
+def hash_array(array):
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{array.shape}{array.dtype}".encode())
+    digest.update(array.data)
+    return digest.hexdigest()
+
+# Hashes of model weight files, keyed by (path, size, mtime) so each file is only read once per process
+_file_hashes = {}
+
+# Function to hash a file (e.g. model weights) by content
+def hash_file(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+# On-disk cache of JSON-serialisable results keyed by content hash + model hash + parameters
+class ResultCache:
+    def __init__(self, db_path, max_size_mb=1024):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, stage TEXT, value TEXT, size INTEGER, last_access REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+
+    # Build a cache key from the stage name, content hash, model hash and stage parameters
+    @staticmethod
+    def make_key(stage, content_hash, model_hash, params):
+        payload = json.dumps([stage, content_hash, model_hash, params], sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    # Look up several keys at once, returning a dict of the ones found and marking them as recently used
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        with self._lock, self._conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            now = time.time()
+            self._conn.executemany("UPDATE results SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    # Store several results at once, then evict the least recently used entries if over the size limit
+    def put_many(self, stage, items):
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            encoded = json.dumps(value)
+            rows.append((key, stage, encoded, len(encoded), now))
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+
+    # Delete the least recently used entries until the cache is back under max_bytes
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_access"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM results WHERE key = ?", stale_keys)
+
+    # Close the database connection
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# View of a ResultCache for one pipeline stage with a fixed model and parameter set
+class StageCache:
+    def __init__(self, cache, stage, model_hash, params=None):
+        self.cache = cache
+        self.stage = stage
+        self.model_hash = model_hash
+        self.params = params or {}
+
+    # Key for one piece of content, with optional per-item parameters (e.g. the boxes to OCR)
+    def key(self, content_hash, extra=None):
+        params = dict(self.params, **extra) if extra else self.params
+        return ResultCache.make_key(self.stage, content_hash, self.model_hash, params)
+
+    # Look up several keys, returning a dict of the cached results
+    def lookup(self, keys):
+        return self.cache.get_many(keys)
+
+    # Store a dict of key -> result
+    def store(self, items):
+        self.cache.put_many(self.stage, items)
+
+    # Return the result for every key, calling compute(miss_indices) -> list of results only for the misses
+    def get_or_compute(self, keys, compute):
+        cached = self.lookup(keys)
+        misses = [k for k, key in enumerate(keys) if key not in cached]
+        if misses:
+            new_entries = dict(zip([keys[k] for k in misses], compute(misses)))
+            self.store(new_entries)
+            cached.update(new_entries)
+        return [cached[key] for key in keys]
+
+# Function to open the result cache described by the cache section of the config, or None if disabled
+def open_result_cache(cache_config):
+    if not cache_config or not cache_config.get('enabled', False):
+        return None
+    return ResultCache(resolve_path(cache_config.get('path', './outputs/cache/results.sqlite')), cache_config.get('max_size_mb', 1024))
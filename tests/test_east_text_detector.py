@@ -0,0 +1,45 @@
+# Description: Tests for the EAST text detector's shared network.
+# Import necessary libraries
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from src.detection import east_text_detector
+from src.detection.east_text_detector import EASTTextDetector
+
+# Stand-in for a cv2.dnn.Net that returns maps derived from its current input, so interleaved calls show up
+class FakeNet:
+    def __init__(self):
+        self.blob = None
+        self.active = 0
+        self.overlaps = 0
+
+    def setInput(self, blob):
+        self.active += 1
+        self.overlaps += self.active > 1
+        self.blob = blob
+
+    def forward(self, layer_names):
+        time.sleep(0.001)
+        n = len(self.blob)
+        scores = np.full((n, 1, 112, 112), float(self.blob[0, 0, 0, 0]), dtype=np.float32)
+        self.active -= 1
+        return scores, np.zeros((n, 5, 112, 112), dtype=np.float32)
+
+def test_detectors_sharing_a_net_do_not_interleave_forward_passes(monkeypatch, tmp_path):
+    net = FakeNet()
+    monkeypatch.setattr(east_text_detector, '_east_models', {})
+    monkeypatch.setattr(east_text_detector.cv2.dnn, 'readNet', lambda model_path: net)
+    model_path = str(tmp_path / 'frozen_east_text_detection.pb')
+    detectors = [EASTTextDetector(model_path, backend='cpu', ocr_engine=object()) for _ in range(4)]
+    assert all(detector.net is net for detector in detectors)
+
+    # Each thread feeds a constant image and must get back maps computed from its own input
+    def run(k):
+        image = np.full((448, 448, 3), 10 * k, dtype=np.uint8)
+        return all(np.isclose(scores[0, 0, 0, 0], 10 * k - 123.68) for _ in range(20)
+                   for scores, _ in detectors[k]._forward([image], rgb=True))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(pool.map(run, range(4)))
+    assert net.overlaps == 0
@@ -0,0 +1,23 @@
+# Description: Tests for reconstructing drawings from directories of patches.
+# Import necessary libraries
+import os
+import numpy as np
+from PIL import Image
+
+from src.postprocessing.image_reconstruction import group_patch_files, reconstruct_images
+
+def test_reconstruction_ignores_text_detection_outputs_next_to_patches(tmp_path):
+    # Text detection writes its per-patch txt and csv outputs into the patch directory in disk mode
+    patches_dir = tmp_path / 'patches'
+    patches_dir.mkdir()
+    Image.fromarray(np.full((448, 448, 3), 200, dtype=np.uint8)).save(patches_dir / 'd1_patch_0_0.jpg')
+    (patches_dir / 'text_extraction_d1_patch_0_0.jpg.txt').write_text('VALVE\n')
+    (patches_dir / 'bounding_boxes_d1_patch_0_0.jpg.csv').write_text('x0,y0,x1,y1\n1,2,3,4\n')
+
+    groups = group_patch_files(patches_dir)
+    assert list(groups) == ['d1']
+    assert [os.path.basename(path) for _, _, path in groups['d1']] == ['d1_patch_0_0.jpg']
+
+    output_dir = tmp_path / 'reconstructed'
+    reconstruct_images(str(patches_dir), str(output_dir))
+    assert sorted(os.listdir(output_dir)) == ['reconstructed_d1.jpg']
@@ -0,0 +1,40 @@
+# Description: Tests for the clients of the resident inference server.
+# Import necessary libraries
+import os
+import cv2
+import numpy as np
+
+from src.pipeline.inference_server import RemoteTextDetector
+from src.pipeline.page_pipeline import _detect_text_in_patch_files
+
+# Stand-in for the inference client: one text box per patch, recording the size of every request
+class FakeClient:
+    def __init__(self):
+        self.request_sizes = []
+
+    def info(self):
+        return {'east_hash': None, 'east_params': None, 'max_batch_size': 2}
+
+    def locate_text(self, images, rgb=True):
+        self.request_sizes.append(len(images))
+        return [[(100, 100, 200, 130)] for _ in images]
+
+# Stand-in for the Tesseract OCR engine
+class FakeOCREngine:
+    def recognise_regions(self, images, boxes_per_image):
+        return [['FV-101'] * len(boxes) for boxes in boxes_per_image]
+
+def test_remote_text_detector_runs_text_detection_over_patch_files(tmp_path):
+    patch_paths = []
+    for j in range(3):
+        patch_path = str(tmp_path / f'd1_patch_0_{j}.jpg')
+        cv2.imwrite(patch_path, np.full((448, 448, 3), 255, dtype=np.uint8))
+        patch_paths.append(patch_path)
+    client = FakeClient()
+    text_detector = RemoteTextDetector.from_server(client, ocr_engine=FakeOCREngine())
+
+    text_boxes, text_results = _detect_text_in_patch_files(text_detector, patch_paths, str(tmp_path / 'TextDetection'))
+
+    assert text_detector.batch_size == 2
+    assert client.request_sizes == [2, 1]
+    assert text_results == {os.path.basename(path): [((100, 100, 200, 130), 'FV-101')] for path in patch_paths}
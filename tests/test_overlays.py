@@ -0,0 +1,20 @@
+# Description: Tests for drawing overlay layers over the original drawings.
+# Import necessary libraries
+import os
+import numpy as np
+from PIL import Image
+
+from src.postprocessing.overlays import render_overlay_preview
+from src.utils.page_store import PageStore
+
+def test_mapped_pages_are_previewed_subsampled_from_the_page_store(tmp_path):
+    Image.fromarray(np.full((900, 600, 3), 255, dtype=np.uint8)).save(tmp_path / 'd1.png')
+    layers = {'symbols': [{'bbox': [300, 300, 600, 450]}], 'text': []}
+    store = PageStore(str(tmp_path / 'store'), 'npy', min_megapixels=0)
+
+    preview = render_overlay_preview(str(tmp_path / 'd1.png'), layers, page_store=store, max_size=300)
+
+    # Every third row and column is kept, and the symbol box is drawn at a third of its page coordinates
+    assert preview.size == (200, 300)
+    assert preview.getpixel((100, 120)) == (255, 0, 0)
+    assert os.listdir(tmp_path / 'store') == []
@@ -0,0 +1,32 @@
+# Description: Tests for the aggregation of patch detections into page coordinates across patch seams.
+# Import necessary libraries
+from src.postprocessing.page_aggregation import aggregate_object_boxes, deduplicate_text_boxes
+
+# Function to build a YOLOv5 box dict as boxes_from_detections does
+def yolo_box(patch_filename, xyxy, confidence, class_label=0):
+    return {'image_filename': patch_filename, 'bbox_type': 'YOLOv5', 'bbox_coordinates': list(xyxy),
+            'confidence_score': confidence, 'class_label': class_label, 'class_name': 'Generic Valve'}
+
+def test_text_boxes_within_one_patch_are_kept():
+    text_boxes = {'d_patch_1_1.jpg': [(100, 100, 300, 140), (110, 105, 180, 135)]}
+    assert deduplicate_text_boxes(text_boxes) == text_boxes
+
+def test_text_box_duplicated_across_a_seam_is_kept_once():
+    # The same text seen cut off at the right edge of patch (0, 0) and whole in patch (0, 1)
+    text_boxes = {'d_patch_0_0.jpg': [(420, 100, 448, 130)], 'd_patch_0_1.jpg': [(4, 100, 60, 130)]}
+    kept = deduplicate_text_boxes(text_boxes)
+    assert kept == {'d_patch_0_0.jpg': [], 'd_patch_0_1.jpg': [(4, 100, 60, 130)]}
+
+def test_object_boxes_within_one_patch_are_kept():
+    object_boxes = {'d_patch_1_1.jpg': [yolo_box('d_patch_1_1.jpg', (100, 100, 300, 300), 0.9),
+                                        yolo_box('d_patch_1_1.jpg', (120, 120, 200, 200), 0.8)]}
+    detections = aggregate_object_boxes(object_boxes)['d']
+    assert [d['confidence_score'] for d in detections] == [0.9, 0.8]
+
+def test_object_box_duplicated_across_a_seam_is_kept_once():
+    object_boxes = {'d_patch_0_0.jpg': [yolo_box('d_patch_0_0.jpg', (420, 100, 448, 150), 0.6)],
+                    'd_patch_0_1.jpg': [yolo_box('d_patch_0_1.jpg', (4, 100, 60, 150), 0.9)]}
+    detections = aggregate_object_boxes(object_boxes)['d']
+    assert len(detections) == 1
+    assert detections[0]['patch_filename'] == 'd_patch_0_1.jpg'
+    assert detections[0]['bbox_coordinates'] == [420.0, 100.0, 476.0, 150.0]
@@ -0,0 +1,46 @@
+# Description: Tests for the streaming page pipeline's incremental runs with the pipeline manifest.
+# Import necessary libraries
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image
+
+from src.pipeline.manifest import PipelineManifest
+from src.pipeline.page_pipeline import process_pages
+from src.utils.detections_store import DetectionsStore
+
+# Stand-in for the YOLOv5 hub model: one symbol per patch
+class FakeObjectModel:
+    names = {0: 'Generic Valve'}
+
+    def __call__(self, images):
+        return SimpleNamespace(xyxy=[np.array([[10, 10, 60, 60, 0.9, 0]], dtype=np.float32) for _ in images])
+
+# Stand-in for the EAST detector and its OCR engine: one tag per patch
+class FakeTextDetector:
+    def locate_text_batch(self, images, rgb=False):
+        return [[(100, 100, 200, 130)] for _ in images]
+
+    def extract_text_batch(self, images, boxes_per_image, draw=False):
+        return [(['FV-101'] * len(boxes), list(boxes)) for boxes in boxes_per_image]
+
+# Function to run the pipeline over image_dir with a manifest and a detections store
+def run_pipeline(tmp_path, image_dir):
+    manifest = PipelineManifest(str(tmp_path / 'pipeline_manifest.json'))
+    store = DetectionsStore(str(tmp_path / 'Detections'))
+    return process_pages(str(image_dir), FakeObjectModel(), FakeTextDetector(), str(tmp_path / 'TextDetection'),
+                         str(tmp_path / 'Output'), min_ink_fraction=0, manifest=manifest, detections_store=store)
+
+def test_rerun_with_manifest_and_detections_store_reloads_unchanged_drawings(tmp_path):
+    image_dir = tmp_path / 'Images'
+    image_dir.mkdir()
+    Image.fromarray(np.full((448, 448, 3), 255, dtype=np.uint8)).save(image_dir / 'd1.jpg')
+
+    _, first_texts, first_outputs, _ = run_pipeline(tmp_path, image_dir)
+    # No per-patch text files are written with the store, so the second run must reload from the Parquet part
+    assert not (tmp_path / 'TextDetection').exists()
+    object_boxes, second_texts, second_outputs, skipped = run_pipeline(tmp_path, image_dir)
+
+    assert first_texts == second_texts == ['FV-101']
+    assert sorted(first_outputs) == sorted(second_outputs)
+    assert list(object_boxes) == ['d1_patch_0_0.jpg']
+    assert skipped == 0
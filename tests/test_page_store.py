@@ -0,0 +1,22 @@
+# Description: Tests for importing scans into the memory-mapped page store.
+# Import necessary libraries
+import numpy as np
+import pytest
+
+from src.utils.page_store import PageStore
+
+tifffile = pytest.importorskip('tifffile')
+
+@pytest.mark.parametrize('layout', [{}, {'compression': 'zlib', 'rowsperstrip': 64}, {'compression': 'zlib', 'tile': (64, 64)}])
+def test_tiff_scans_are_imported_window_by_window(tmp_path, layout):
+    # 300 x 200 does not divide into 64 x 64 tiles, so the edge tiles are padded in the file
+    image = (np.arange(300 * 200 * 3) % 251).astype(np.uint8).reshape(300, 200, 3)
+    tifffile.imwrite(tmp_path / 'scan.tif', image, photometric='rgb', **layout)
+    store = PageStore(str(tmp_path / 'store'), 'npy')
+    assert np.array_equal(store.import_image('scan', str(tmp_path / 'scan.tif')), image)
+
+def test_grey_tiff_scans_are_imported_as_rgb(tmp_path):
+    image = (np.arange(300 * 200) % 251).astype(np.uint8).reshape(300, 200)
+    tifffile.imwrite(tmp_path / 'scan.tif', image, photometric='minisblack', compression='zlib')
+    store = PageStore(str(tmp_path / 'store'), 'npy')
+    assert np.array_equal(store.import_image('scan', str(tmp_path / 'scan.tif')), np.repeat(image[..., None], 3, axis=2))
@@ -0,0 +1,38 @@
+# Description: Tests for running YOLOv5 models over batches of patches.
+# Import necessary libraries
+import json
+import zipfile
+from types import SimpleNamespace
+import numpy as np
+
+from src.detection.yolo_object_detection import _detect_in_batches, exported_batch_size
+
+# Stand-in for a TorchScript hub model that only accepts the batch size it was traced at
+class FixedBatchModel:
+    names = {0: 'Generic Valve'}
+    fixed_batch_size = 4
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, images):
+        assert len(images) == self.fixed_batch_size
+        self.batch_sizes.append(len(images))
+        return SimpleNamespace(xyxy=[np.array([[10, 10, 60, 60, 0.9, 0]], dtype=np.float32) for _ in images])
+
+def test_fixed_batch_models_get_full_batches(tmp_path):
+    model = FixedBatchModel()
+    images = [np.zeros((448, 448, 3), dtype=np.uint8) for _ in range(6)]
+    filenames = [f'd_patch_0_{j}.jpg' for j in range(6)]
+
+    # The configured batch size of 32 is overridden by the traced one, and the short last batch is padded
+    boxes = _detect_in_batches(images, filenames, model, batch_size=32)
+
+    assert model.batch_sizes == [4, 4]
+    assert sorted(boxes) == sorted(filenames)
+
+def test_exported_batch_size_is_read_from_the_torchscript_archive(tmp_path):
+    model_path = tmp_path / 'best.torchscript'
+    with zipfile.ZipFile(model_path, 'w') as archive:
+        archive.writestr('best/extra/config.txt', json.dumps({'shape': [32, 3, 448, 448], 'stride': 32}))
+    assert exported_batch_size(str(model_path)) == 32